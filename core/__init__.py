@@ -1,3 +1,3 @@
 from sqlman.core.connector import Connector
 from sqlman.core.controller import Controller
-from sqlman.core.v2 import MySQL, Table
+from sqlman.core.v2 import MySQL, Table, ShardedMySQL
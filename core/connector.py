@@ -6,11 +6,12 @@ from dbutils.pooled_db import PooledDB
 from loguru import logger
 from pymysql.cursors import DictCursor
 
+from sqlman.core.v2.meta import MetaCache
 from sqlman.tools import make_result, getfv
 
 
 class Connector:
-    def __init__(self, host=None, port=None, username=None, password=None, db=None, **kwargs):
+    def __init__(self, host=None, port=None, username=None, password=None, db=None, meta_ttl=60, **kwargs):
         """
         连接MySQL
 
@@ -20,6 +21,7 @@ class Connector:
             username: 用户
             password: 密码
             db: 数据库
+            meta_ttl: 表名缓存的有效秒数，None表示不过期
             **kwargs: 跟PooledDB参数保持一致
         """
         cfg = dict(
@@ -37,6 +39,7 @@ class Connector:
         cfg.update(kwargs)
         self._cfg = cfg
         self._pool = PooledDB(pymysql, **self._cfg)
+        self._meta = MetaCache(self, ttl=meta_ttl)
 
     @classmethod
     def from_url(cls, url: str):
@@ -51,14 +54,18 @@ class Connector:
         )
 
     def __getitem__(self, name: str):
-        assert name in self.get_tables(), f"table <{name}> is not exists"
+        assert self._meta.has_table(name), f"table <{name}> is not exists"
         from sqlman.core.controller import Controller
-        return Controller(name, self._pool, self._cfg)
+        return Controller(name, self._pool, self._cfg, db=self)
 
     def pick_table(self, name: str):
         """选择表"""
         return self.__getitem__(name)
 
+    def refresh(self, name: str = None):
+        """刷新表名缓存"""
+        self._meta.invalidate(name)
+
     @staticmethod
     def panic(sql, msg):
         """错误日志"""
@@ -173,7 +180,10 @@ class Connector:
     def remove_table(self, name: str) -> bool:
         """删除表"""
         sql = 'DROP TABLE {}'.format(name)
-        return self.exe_sql(sql)['status'] == 1
+        ok = self.exe_sql(sql)['status'] == 1
+        if ok:
+            self._meta.invalidate(name)
+        return ok
 
     def gen_test_table(self, name: str, once=1000, total=10000):
         """生成测试表并补充数据，然后返回这个表格对象"""
@@ -203,7 +213,9 @@ class Connector:
                 ) 
                 ENGINE=InnoDB    DEFAULT CHARSET=utf8mb4;
             '''.format(name)
-            return self.exe_sql(sql)['status']
+            status = self.exe_sql(sql)['status']
+            self._meta.invalidate(name)
+            return status
 
         def make_one():
             """制造一条数据"""
@@ -4,16 +4,18 @@ from dbutils.pooled_db import PooledDB
 from loguru import logger
 
 from sqlman.core.connector import Connector
+from sqlman.core.v2.meta import MetaCache
 from sqlman.tools import make_set, make_where, make_tail, check_items, print_lines
 
 
 class Controller(Connector):
     """表格控制者"""
 
-    def __init__(self, name: str, pool: PooledDB, cfg: dict):
+    def __init__(self, name: str, pool: PooledDB, cfg: dict, db: Connector = None):
         self.name = "`{}`".format(name)
         self._pool = pool
         self._cfg = cfg
+        self._meta = db._meta if db else MetaCache(self)
 
     def remove(self) -> bool:
         """删除这张表"""
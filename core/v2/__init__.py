@@ -1,2 +1,3 @@
 from sqlman.core.v2.db import MySQL
 from sqlman.core.v2.table import Table
+from sqlman.core.v2.shard import ShardedMySQL, ShardedTable
@@ -0,0 +1,141 @@
+import threading
+import time
+from collections import OrderedDict
+
+from sqlman.tools import estimate_bytes
+
+
+class ResultCache:
+    """
+    查询结果缓存：LRU + TTL + 总字节数上限\n
+    表有写操作时整体失效；写操作之前开始、之后才结束的查询不会被缓存（通过generation判断）
+    """
+
+    def __init__(self, ttl: float = 60, max_entries=1024, max_bytes=16 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (写入时间, 字节数, 值)
+        self._bytes = 0
+        self._counters = dict(hits=0, misses=0, evictions=0, expirations=0, invalidations=0)
+
+    @staticmethod
+    def sizeof(value) -> int:
+        """估算结果占用的字节数"""
+        if isinstance(value, list):
+            return 64 + sum(100 + estimate_bytes(row.values() if hasattr(row, 'values') else row) for row in value)
+        if hasattr(value, 'values'):
+            return 100 + estimate_bytes(value.values())
+        return 64
+
+    def get(self, key) -> tuple:
+        """返回 (是否命中, 值)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters['misses'] += 1
+                return False, None
+            if self.ttl is not None and time.time() - entry[0] >= self.ttl:
+                self._drop(key)
+                self._counters['expirations'] += 1
+                self._counters['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._counters['hits'] += 1
+            return True, entry[2]
+
+    def put(self, key, value, generation: int):
+        """写入缓存，generation与当前不一致（期间有写操作）时放弃"""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time(), size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[1]
+
+    def invalidate(self):
+        """清空缓存"""
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._counters['invalidations'] += 1
+
+    def stats(self) -> dict:
+        """命中、未命中、淘汰等计数，以及当前条目数和字节数"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['misses']
+            return dict(
+                self._counters,
+                hit_rate=self._counters['hits'] / lookups if lookups else 0.0,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes
+            )
+
+    def reset_stats(self):
+        with self._lock:
+            for k in self._counters:
+                self._counters[k] = 0
+
+
+def copy_row(row):
+    """复制一行，只读的TupleRow直接复用"""
+    if isinstance(row, dict):
+        return dict(row)
+    if hasattr(row, '__slots__') and hasattr(row, '__setitem__'):
+        return type(row)(row.values())
+    return row
+
+
+def copy_result(value):
+    """复制查询结果，避免调用方修改行对象污染缓存"""
+    if not isinstance(value, list):
+        return value
+    return [copy_row(row) for row in value]
+
+
+_caches = {}  # 表标识 -> {缓存类型: ResultCache}
+_caches_lock = threading.Lock()
+
+
+def get_cache(key: tuple, kind='result') -> ResultCache | None:
+    """获取表的缓存，未开启时返回None；同一进程内同一张表共享\n
+    kind：'result'为查询结果缓存，'rows'为get_many的按主键行缓存"""
+    return _caches.get(key, {}).get(kind)
+
+
+def set_cache(key: tuple, cache: ResultCache | None, kind='result'):
+    """开启（cache不为None）或关闭表的缓存"""
+    with _caches_lock:
+        if cache is None:
+            _caches.get(key, {}).pop(kind, None)
+        else:
+            _caches.setdefault(key, {})[kind] = cache
+
+
+def setdefault_cache(key: tuple, kind: str, **kwargs) -> ResultCache:
+    """获取表的缓存，不存在则按kwargs创建"""
+    with _caches_lock:
+        caches = _caches.setdefault(key, {})
+        if kind not in caches:
+            caches[kind] = ResultCache(**kwargs)
+        return caches[kind]
+
+
+def table_caches(key: tuple) -> list:
+    """表的所有缓存"""
+    return list(_caches.get(key, {}).values())
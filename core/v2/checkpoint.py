@@ -0,0 +1,134 @@
+import os
+import tempfile
+import threading
+
+from sqlman.tools import dump_json, load_json
+
+
+class FileCheckpoint:
+    """本地文件检查点，先写临时文件再原子替换，进程在任何时刻退出文件都是完整的"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> dict | None:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding='utf8') as f:
+            return load_json(f.read())
+
+    def save(self, state: dict):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=folder, prefix='.checkpoint-')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf8') as f:
+                f.write(dump_json(state))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class TableCheckpoint:
+    """
+    MySQL表检查点，保存在 <table>(name, state, updated_at) 中，任何一台机器都可以接着执行同一个任务\n
+    注意传入主库的MySQL实例
+    """
+
+    def __init__(self, db, name: str, table='sqlman_checkpoints'):
+        self.db = db
+        self.name = name
+        self.table = '`{}`'.format(table.strip('`'))
+        sql = '''
+            create table if not exists {} (
+                name varchar(191) primary key,
+                state longtext not null,
+                updated_at timestamp not null default current_timestamp on update current_timestamp
+            )
+        '''.format(self.table)
+        db.exe_sql(sql, allow_failed=False)
+
+    def load(self) -> dict | None:
+        sql = 'select state from {} where name = %s'.format(self.table)
+        row = self.db.exe_sql(sql, args=[self.name], query_all=False, to_dict=False, allow_failed=False).result
+        return load_json(row[0]) if row else None
+
+    def save(self, state: dict):
+        sql = 'insert into {} (name, state) values (%s, %s) on duplicate key update state = values(state)'
+        self.db.exe_sql(sql.format(self.table), args=[self.name, dump_json(state)], allow_failed=False)
+
+    def clear(self):
+        sql = 'delete from {} where name = %s'.format(self.table)
+        self.db.exe_sql(sql, args=[self.name], allow_failed=False)
+
+
+def make_checkpoint(checkpoint):
+    """字符串为本地文件路径，否则为实现了load、save、clear的对象（比如TableCheckpoint）"""
+    if isinstance(checkpoint, str):
+        return FileCheckpoint(checkpoint)
+    assert all(hasattr(checkpoint, m) for m in ('load', 'save', 'clear')), "checkpoint must be a path or a backend"
+    return checkpoint
+
+
+class ScanProgress:
+    """
+    scan的进度：每个分片的区间、最后处理的排序字段值、是否完成\n
+    每次dealer成功后保存一次，恢复时从最后保存的位置之后继续（至少一次：保存前中断的那一批会再处理一次）
+    """
+
+    def __init__(self, store, table: str, keys: list):
+        self.store = store
+        self.table = table
+        self.keys = list(keys)
+        self._lock = threading.Lock()
+        self.state = store.load()
+        self.resumed = self.state is not None
+        if self.resumed and (self.state['table'] != table or self.state['keys'] != self.keys):
+            raise ValueError('checkpoint belongs to {} {}, not {} {}'.format(
+                self.state['table'], self.state['keys'], table, self.keys
+            ))
+
+    @property
+    def ranges(self) -> list:
+        return [(s['start'], s['end']) for s in self.state['shards']]
+
+    def begin(self, ranges: list):
+        """新任务：记录分片"""
+        self.state = dict(
+            table=self.table, keys=self.keys,
+            shards=[dict(start=lo, end=hi, last=None, rows=0, done=False) for lo, hi in ranges]
+        )
+        self.store.save(self.state)
+
+    def shard(self, i: int) -> dict:
+        with self._lock:
+            return dict(self.state['shards'][i])
+
+    def advance(self, i: int, last: tuple, count: int):
+        """第i个分片处理完一批"""
+        with self._lock:
+            shard = self.state['shards'][i]
+            shard['last'] = list(last)
+            shard['rows'] += count
+            self.store.save(self.state)
+
+    def finish(self, i: int):
+        """第i个分片处理完了"""
+        with self._lock:
+            self.state['shards'][i]['done'] = True
+            self.store.save(self.state)
+
+    def complete(self) -> bool:
+        """所有分片都完成时清除检查点，返回是否完成"""
+        with self._lock:
+            if all(s['done'] for s in self.state['shards']):
+                self.store.clear()
+                return True
+            return False
@@ -0,0 +1,116 @@
+import threading
+import time
+
+
+class MetaCache:
+    """
+    表结构元数据缓存
+
+    缓存当前数据库的表名列表，以及每张表的字段、类型、索引信息，
+    超过 ttl 秒后自动重新查询，ttl 为 None 则永不过期（只能手动 invalidate）
+    """
+
+    def __init__(self, db, ttl: float = 60):
+        self._db = db
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tables = None
+        self._tables_at = 0.0
+        self._schemas = {}
+        self._variables = {}
+        self._states = {}
+        self.features = {}  # 实例级别的能力标记，比如 LOAD DATA LOCAL INFILE 是否可用
+
+    def fresh(self, at: float) -> bool:
+        """缓存时间at是否还在有效期内"""
+        return self.ttl is None or time.time() - at < self.ttl
+
+    def tables(self, refresh=False) -> list:
+        """获取表名列表（带缓存）"""
+        with self._lock:
+            if not refresh and self._tables is not None and self.fresh(self._tables_at):
+                return self._tables
+        tables = self._db.get_tables()
+        with self._lock:
+            self._tables, self._tables_at = tables, time.time()
+        return tables
+
+    def has_table(self, name: str) -> bool:
+        """表是否存在，缓存未命中时会重新查询一次，以发现外部新建的表"""
+        name = name.strip('`')
+        if name in self.tables():
+            return True
+        return name in self.tables(refresh=True)
+
+    def schema(self, name: str, refresh=False) -> dict:
+        """
+        获取表结构
+
+        Returns:
+            {
+                'columns': [字段, ...],
+                'types': {字段: 类型},
+                'indexes': {索引名: [字段, ...]},
+                'unique': {唯一索引名: [字段, ...]},
+                'primary': [主键字段, ...]
+            }
+        """
+        name = name.strip('`')
+        with self._lock:
+            hit = self._schemas.get(name)
+            if not refresh and hit and self.fresh(hit[0]):
+                return hit[1]
+
+        sql = '''
+            select column_name, data_type from information_schema.columns
+            where table_schema = database() and table_name = %s
+            order by ordinal_position
+        '''
+        rows = self._db.exe_sql(sql, args=[name], query_all=True, to_dict=False).result or ()
+        columns = [r[0] for r in rows]
+        types = {r[0]: r[1] for r in rows}
+
+        sql = '''
+            select index_name, column_name, non_unique from information_schema.statistics
+            where table_schema = database() and table_name = %s
+            order by index_name, seq_in_index
+        '''
+        rows = self._db.exe_sql(sql, args=[name], query_all=True, to_dict=False).result or ()
+        indexes, unique = {}, {}
+        for index_name, column_name, non_unique in rows:
+            indexes.setdefault(index_name, []).append(column_name)
+            if not int(non_unique):
+                unique.setdefault(index_name, []).append(column_name)
+
+        schema = dict(
+            columns=columns, types=types, indexes=indexes, unique=unique, primary=indexes.get('PRIMARY', [])
+        )
+        with self._lock:
+            self._schemas[name] = (time.time(), schema)
+        return schema
+
+    def variable(self, name: str):
+        """获取服务端变量（比如max_allowed_packet），查询失败返回None"""
+        with self._lock:
+            hit = self._variables.get(name)
+            if hit and self.fresh(hit[0]):
+                return hit[1]
+        result = self._db.exe_sql('select @@{}'.format(name), query_all=False, to_dict=False).result
+        value = result[0] if result else None
+        with self._lock:
+            self._variables[name] = (time.time(), value)
+        return value
+
+    def state(self, name: str) -> dict:
+        """表的运行时状态，同一个MySQL实例取出的所有Table对象共享，不会失效"""
+        with self._lock:
+            return self._states.setdefault(name.strip('`'), {})
+
+    def invalidate(self, name: str = None):
+        """使缓存失效，不传表名则清空全部"""
+        with self._lock:
+            self._tables = None
+            if name is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop(name.strip('`'), None)
@@ -0,0 +1,164 @@
+import re
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+
+from sqlman.tools import estimate_bytes
+
+# 直方图的桶上界（秒）：10微秒起，每个桶比上一个大25%，约到590秒
+BOUNDS = [1e-5 * 1.25 ** i for i in range(81)]
+
+# 每次调用都不同的生成名：update_bulk的临时表 tmp_<表名>_<随机串>
+GENERATED = re.compile(r'\b(tmp_\w+?_)[0-9a-f]{8}\b')
+
+# 超出语句数上限后，新的指纹都记在这里
+OTHER = '<other>'
+
+
+class Histogram:
+    """对数分桶的耗时直方图，分位数误差在一个桶（25%）以内"""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.counts[bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """分位数（取所在桶的上界，不超过最大值）"""
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return min(BOUNDS[i] if i < len(BOUNDS) else self.max, self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        return dict(
+            count=self.count,
+            total=self.total,
+            avg=self.total / self.count if self.count else 0.0,
+            p50=self.quantile(0.5),
+            p95=self.quantile(0.95),
+            p99=self.quantile(0.99),
+            max=self.max
+        )
+
+
+@lru_cache(maxsize=4096)
+def fingerprint(sql: str) -> str:
+    """
+    语句指纹：字面量、生成的临时表名替换为?，IN列表合并为(?+)，空白合并，小写\n
+    比如 select * from t where id in (1, 2, 3) and name='a' -> select * from t where id in (?+) and name=?
+    """
+    sql = GENERATED.sub(lambda m: m.group(1) + '?', sql)
+    sql = re.sub(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"", '?', sql)
+    sql = re.sub(r'%s|\b\d+(?:\.\d+)?\b|\bnull\b', '?', sql, flags=re.I)
+    # IN列表、VALUES（包括多行）不论多少个都合并为 (?+)
+    sql = re.sub(
+        r'\b(in|values?)\s*\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*',
+        lambda m: m.group(1) + ' (?+)', sql, flags=re.I
+    )
+    return re.sub(r'\s+', ' ', sql).strip().lower()
+
+
+class Metrics:
+    """
+    语句级别的指标：每个语句指纹的耗时直方图、行数、收发字节数估算、错误数，
+    以及连接池等待时间、scan的dealer耗时等命名计时\n
+    最多记录max_statements个指纹，之后新的指纹合并记在 <other> 下，内存有上限
+    """
+
+    def __init__(self, max_statements=1000):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._timings = {}
+        self.errors = 0
+
+    def record(self, sql: str, seconds: float, rows=0, sent=0, received=0, error=False):
+        """记录一次语句执行"""
+        key = fingerprint(sql)
+        with self._lock:
+            item = self._statements.get(key)
+            if item is None and len(self._statements) >= self.max_statements:
+                key = OTHER
+                item = self._statements.get(key)
+            if item is None:
+                item = self._statements[key] = dict(latency=Histogram(), rows=0, sent=0, received=0, errors=0)
+            item['latency'].add(seconds)
+            item['rows'] += rows
+            item['sent'] += sent
+            item['received'] += received
+            if error:
+                item['errors'] += 1
+                self.errors += 1
+
+    def timing(self, name: str, seconds: float):
+        """记录一次命名计时（比如 pool_wait、dealer）"""
+        with self._lock:
+            histogram = self._timings.get(name)
+            if histogram is None:
+                histogram = self._timings[name] = Histogram()
+            histogram.add(seconds)
+
+    def stats(self, top: int = None) -> dict:
+        """
+        汇总指标
+
+        Args:
+            top: 只返回总耗时最多的top个语句，None为全部
+
+        Returns:
+            {
+                'statements': {指纹: {count, total, avg, p50, p95, p99, max, rows, sent, received, errors}},
+                'pool_wait': {count, total, avg, p50, p95, p99, max}, 'dealer': {...},
+                'errors': 错误总数
+            }
+        """
+        with self._lock:
+            statements = {
+                key: dict(item['latency'].summary(), **{k: v for k, v in item.items() if k != 'latency'})
+                for key, item in self._statements.items()
+            }
+            timings = {name: histogram.summary() for name, histogram in self._timings.items()}
+            errors = self.errors
+        ordered = sorted(statements.items(), key=lambda kv: kv[1]['total'], reverse=True)
+        return dict(statements=dict(ordered[:top] if top else ordered), errors=errors, **timings)
+
+    def reset(self):
+        """清空指标"""
+        with self._lock:
+            self._statements.clear()
+            self._timings.clear()
+            self.errors = 0
+
+
+def sent_bytes(sql: str, args) -> int:
+    """估算发送的字节数"""
+    if not args:
+        return len(sql)
+    if isinstance(args, (list, tuple)) and args and isinstance(args[0], (list, tuple, dict)):  # executemany
+        sample = args[:8]
+        per_row = sum(estimate_bytes(a.values() if isinstance(a, dict) else a) for a in sample) / len(sample)
+        return len(sql) * len(args) + int(per_row * len(args))
+    return len(sql) + estimate_bytes(args.values() if isinstance(args, dict) else args)
+
+
+def received_bytes(rows, count: int) -> int:
+    """按前几行估算接收的字节数"""
+    if not rows or count <= 0:
+        return 0
+    sample = rows[:8]
+    per_row = sum(estimate_bytes(r.values() if isinstance(r, dict) else r) for r in sample) / len(sample)
+    return int(per_row * count)
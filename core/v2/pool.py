@@ -0,0 +1,246 @@
+import re
+import threading
+import time
+import weakref
+from collections import deque
+
+import dbutils
+import pymysql
+from dbutils.pooled_db import PooledDB
+
+from sqlman.core.v2.metrics import Histogram
+
+# 自定义的ping位：dbutils只会自动检查1、2、4位，这一位只在连接空闲超过ping_idle秒后由Pool手动触发
+PING_IDLE = 16
+
+# dbutils没有公开空闲连接缓存、单个底层连接的接口，收缩空闲缓存和按空闲时间ping用到了它的内部属性，
+# 只在验证过的版本（2.x、3.x）上使用；其他版本这两个功能退化为不收缩空闲缓存、每次取出都ping
+_DBUTILS_VERSION = tuple(int(v) for v in re.findall(r'\d+', getattr(dbutils, '__version__', '0'))[:2])
+INTERNALS = (2, 0) <= _DBUTILS_VERSION < (4, 0)
+
+
+def _idle_cache(pool: PooledDB) -> tuple:
+    """PooledDB的空闲连接列表和锁，不支持时返回 (None, None)"""
+    idle, lock = getattr(pool, '_idle_cache', None), getattr(pool, '_lock', None)
+    if INTERNALS and isinstance(idle, list) and lock is not None:
+        return idle, lock
+    return None, None
+
+
+def _steady(con):
+    """取出的连接对应的SteadyDBConnection（归还后在空闲缓存中复用），不支持时返回None"""
+    steady = getattr(con, '_con', None) if INTERNALS else None
+    return steady if hasattr(steady, '_ping_check') else None
+
+
+class PoolTimeoutError(TimeoutError):
+    """在timeout秒内没有拿到连接"""
+
+
+class PoolConnection:
+    """从Pool取出的连接，close时归还连接并释放名额（可重复close）"""
+    __slots__ = ('_con', '_pool', '_closed')
+
+    def __init__(self, con, pool):
+        self._con = con
+        self._pool = pool
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._con, name)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        steady = _steady(self._con)
+        try:
+            self._con.close()
+        finally:
+            self._pool._release(steady)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class Pool:
+    """
+    PooledDB的包装：统计使用中、空闲、等待的连接数和等待时间，取连接可以超时，
+    启动时预热连接，按观察到的等待时间在 [min_size, max_size] 之间自动扩缩容，
+    空闲较久的连接在取出时先ping（断开则重连），避免空闲后的第一条语句失败
+    """
+
+    def __init__(
+            self, timeout: float = None, prewarm=0, adaptive=False, ping_idle: float = None,
+            grow_wait=0.01, window=100, **cfg
+    ):
+        """
+        Args:
+            timeout: 取连接的最长等待秒数，超时抛出PoolTimeoutError，None为一直等待
+            prewarm: 启动时预先建立的连接数（不超过maxconnections）
+            adaptive: 是否自动扩缩容，开启时从max(mincached, prewarm, 2)个名额开始，在 [max(mincached, 2), maxconnections] 之间调整
+            ping_idle: 连接空闲超过这么多秒后，取出时先ping一次（替代PooledDB默认的每次取出都ping，dbutils版本不支持时不生效）
+            grow_wait: 自动扩容的等待时间阈值（秒），最近window次取连接中超过10%等待超过它时扩容
+            window: 自动扩缩容参考最近多少次取连接
+            **cfg: PooledDB参数及连接参数（maxconnections为名额上限，maxcached为0表示空闲连接不限）
+        """
+        self.max_size = cfg.get('maxconnections') or 10
+        # 名额至少2个（不超过上限）：一条语句占着连接时，慢语句的EXPLAIN、嵌套的读取还能拿到连接
+        self.min_size = min(self.max_size, max(2, cfg.get('mincached') or 0))
+        self.size = max(self.min_size, min(prewarm, self.max_size)) if adaptive else self.max_size
+        self.timeout = timeout
+        self.adaptive = adaptive
+        self.ping_idle = ping_idle if INTERNALS else None
+        self.grow_wait = grow_wait
+
+        cfg['maxconnections'] = self.max_size
+        if cfg.get('maxcached') and cfg['maxcached'] < prewarm:  # 保证预热的连接都能留在空闲缓存中
+            cfg['maxcached'] = prewarm
+        if self.ping_idle is not None:
+            cfg['ping'] = PING_IDLE
+        self._pool = PooledDB(pymysql, **cfg)
+
+        self._cond = threading.Condition()
+        self._in_use = 0
+        self._waiting = 0
+        self._peak = 0  # 上次调整以来的使用峰值
+        self._waits = deque(maxlen=window)
+        self._wait_hist = Histogram()
+        self._counters = dict(checkouts=0, timeouts=0, grows=0, shrinks=0, pings=0)
+        self._released = weakref.WeakKeyDictionary()  # 底层连接 -> 上次归还的时间
+        if prewarm:
+            self.prewarm(prewarm)
+
+    def connection(self, timeout: float = None, blocking=True) -> PoolConnection:
+        """
+        取一个连接，名额用完时等待（最多timeout秒，不传则使用Pool的timeout）\n
+        blocking为False时不等待，没有空闲名额直接抛出PoolTimeoutError（不计入timeouts），用于EXPLAIN这类可以放弃的辅助语句
+        """
+        timeout = self.timeout if timeout is None else timeout
+        began = time.perf_counter()
+        with self._cond:
+            if not blocking and self._in_use >= self.size:
+                raise PoolTimeoutError('没有空闲的数据库连接（使用中{}，名额{}）'.format(self._in_use, self.size))
+            self._waiting += 1
+            try:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while self._in_use >= self.size:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._counters['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            '{}秒内没有拿到数据库连接（使用中{}，名额{}，等待中{}）'.format(
+                                timeout, self._in_use, self.size, self._waiting
+                            )
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+            self._in_use += 1
+            self._peak = max(self._peak, self._in_use)
+            waited = time.perf_counter() - began
+            self._waits.append(waited)
+            self._wait_hist.add(waited)
+            self._counters['checkouts'] += 1
+            if self.adaptive and self._counters['checkouts'] % self._waits.maxlen == 0:
+                self._adapt()
+
+        try:
+            con = self._pool.connection(shareable=False)
+        except BaseException:
+            self._release()
+            raise
+        if self.ping_idle is not None:
+            self._ping_if_idle(con)
+        return PoolConnection(con, self)
+
+    def _ping_if_idle(self, con):
+        """连接空闲超过ping_idle秒时ping一次，断开则重连"""
+        steady = _steady(con)
+        if steady is None:
+            return
+        with self._cond:
+            released = self._released.get(steady)
+        if released is not None and time.monotonic() - released >= self.ping_idle:
+            steady._ping_check(PING_IDLE)
+            self._counters['pings'] += 1
+
+    def _release(self, steady=None):
+        with self._cond:
+            self._in_use -= 1
+            if steady is not None and self.ping_idle is not None:
+                self._released[steady] = time.monotonic()
+            self._cond.notify()
+
+    def _adapt(self):
+        """根据最近的等待时间扩缩容（调用时已持有锁）"""
+        slow = sum(1 for w in self._waits if w >= self.grow_wait)
+        if slow > len(self._waits) * 0.1 and self.size < self.max_size:
+            self.size = min(self.max_size, self.size + max(1, self.size // 4))
+            self._counters['grows'] += 1
+            self._cond.notify_all()
+        elif not slow and self._peak < self.size - 1 and self.size > self.min_size:
+            self.size = max(self.min_size, self._peak + 1)
+            self._counters['shrinks'] += 1
+            self._trim()
+        self._peak = self._in_use
+
+    def _trim(self):
+        """空闲连接数不超过当前名额（dbutils版本不支持时不收缩）"""
+        idle, lock = _idle_cache(self._pool)
+        if idle is None:
+            return
+        with lock:
+            while len(idle) > self.size:
+                try:
+                    idle.pop().close()
+                except Exception:
+                    pass
+
+    @property
+    def in_use(self) -> int:
+        """使用中的连接数"""
+        return self._in_use
+
+    def prewarm(self, n: int):
+        """预先建立n个连接放入空闲缓存（不超过当前名额，自动扩缩容时启动名额已经包含prewarm）"""
+        cons = [self.connection() for _ in range(min(n, self.size))]
+        for con in cons:
+            con.close()
+
+    def resize(self, size: int):
+        """手动调整名额（限制在 [min_size, max_size] 之间）"""
+        with self._cond:
+            self.size = max(self.min_size, min(self.max_size, size))
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {size, min_size, max_size, in_use, idle（dbutils版本不支持时为None）, waiting, checkouts, timeouts, grows, shrinks, pings,
+             wait: {count, total, avg, p50, p95, p99, max}}
+        """
+        idle, _ = _idle_cache(self._pool)
+        with self._cond:
+            return dict(
+                size=self.size,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                in_use=self._in_use,
+                idle=None if idle is None else len(idle),
+                waiting=self._waiting,
+                wait=self._wait_hist.summary(),
+                **self._counters
+            )
+
+    def close(self):
+        self._pool.close()
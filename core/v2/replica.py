@@ -0,0 +1,75 @@
+import itertools
+import threading
+import time
+
+from pymysql.err import InterfaceError, OperationalError
+
+from sqlman.core.v2.pool import PoolTimeoutError
+
+# 视为从库不可用的异常（SQL本身的错误不算）
+REPLICA_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError)
+
+
+class Replica:
+    """一个从库：连接池 + 连续失败次数 + 剔除截止时间"""
+    __slots__ = ('name', 'pool', 'failures', 'evicted_until', 'errors')
+
+    def __init__(self, name: str, pool):
+        self.name = name
+        self.pool = pool
+        self.failures = 0
+        self.evicted_until = 0.0
+        self.errors = 0
+
+    @property
+    def in_flight(self) -> int:
+        return getattr(self.pool, 'in_use', 0)
+
+
+class ReplicaSet:
+    """
+    从库集合：按轮询（round_robin）或最少使用中连接（least_loaded）选择从库，
+    连续失败max_failures次的从库被剔除cooldown秒，之后重新参与选择
+    """
+
+    def __init__(self, replicas: list, policy='round_robin', max_failures=3, cooldown: float = 30):
+        assert policy in ('round_robin', 'least_loaded'), "policy must be 'round_robin' or 'least_loaded'"
+        self.replicas = replicas
+        self.policy = policy
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+
+    def pick(self) -> Replica | None:
+        """选择一个可用的从库，全部不可用时返回None（读主库）"""
+        now = time.monotonic()
+        alive = [r for r in self.replicas if r.evicted_until <= now]
+        if not alive:
+            return None
+        if self.policy == 'least_loaded':
+            return min(alive, key=lambda r: r.in_flight)
+        return alive[next(self._counter) % len(alive)]
+
+    def failed(self, replica: Replica, e: Exception):
+        """记录一次失败，连接类错误连续达到max_failures次时剔除"""
+        if not isinstance(e, REPLICA_ERRORS):
+            return
+        with self._lock:
+            replica.errors += 1
+            replica.failures += 1
+            if replica.failures >= self.max_failures:
+                replica.evicted_until = time.monotonic() + self.cooldown
+                replica.failures = 0
+
+    def succeeded(self, replica: Replica):
+        if replica.failures:
+            with self._lock:
+                replica.failures = 0
+
+    def stats(self) -> list:
+        now = time.monotonic()
+        return [
+            dict(name=r.name, in_flight=r.in_flight, errors=r.errors, evicted=r.evicted_until > now)
+            for r in self.replicas
+        ]
@@ -0,0 +1,130 @@
+import keyword
+from functools import lru_cache
+
+
+class TupleRow(tuple):
+    """
+    紧凑行：tuple + 同一结果集共享的字段索引\n
+    支持 row['id']、row.id、row.get('id')、dict(row)，只读；注意直接迭代得到的是值而不是字段名
+    """
+    __slots__ = ()
+    _fields: tuple = ()
+    _index: dict = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        try:
+            return tuple.__getitem__(self, self._index[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def get(self, key, default=None):
+        i = self._index.get(key)
+        return default if i is None else tuple.__getitem__(self, i)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def to_dict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return 'Row({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in zip(self._fields, self)))
+
+
+class SlotsRow:
+    """紧凑行：按结果集的字段动态生成 __slots__ 类，支持 row['id']、row.id、row.get('id')、dict(row)，可修改"""
+    __slots__ = ()
+    _fields: tuple = ()
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __eq__(self, other):
+        if isinstance(other, SlotsRow):
+            return self.to_dict() == other.to_dict()
+        return self.to_dict() == other
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(getattr(self, k) for k in self._fields)
+
+    def items(self):
+        return zip(self._fields, self.values())
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def __repr__(self):
+        return 'Row({})'.format(', '.join('{}={!r}'.format(k, v) for k, v in self.items()))
+
+
+def dict_row(fields: tuple):
+    """构造dict行的函数，字段名与行对象的方法重名时使用"""
+    return lambda values: dict(zip(fields, values))
+
+
+@lru_cache(maxsize=256)
+def tuple_row_class(fields: tuple):
+    """每种字段组合生成一个TupleRow子类（有缓存），字段名与方法、属性重名时（比如count、items）退回dict"""
+    if any(f in dir(TupleRow) for f in fields):
+        return dict_row(fields)
+    return type('Row', (TupleRow,), dict(__slots__=(), _fields=fields, _index={k: i for i, k in enumerate(fields)}))
+
+
+@lru_cache(maxsize=256)
+def slots_row_class(fields: tuple):
+    """每种字段组合生成一个SlotsRow子类（有缓存），字段名不是合法标识符、与方法重名时（比如items、get）退回TupleRow"""
+    if not all(f.isidentifier() and not keyword.iskeyword(f) and not f.startswith('_') for f in fields) \
+            or len(set(fields)) != len(fields) or any(f in dir(SlotsRow) for f in fields):
+        return tuple_row_class(fields)
+    namespace = dict(__slots__=fields, _fields=fields)
+    # 与namedtuple一样生成__init__，按位置一次性赋值
+    code = 'def __init__(self, values):\n    {} = values'.format(', '.join('self.{}'.format(f) for f in fields) + ',')
+    exec(code, namespace)
+    return type('Row', (SlotsRow,), namespace)
+
+
+ROW_FACTORIES = {'tuple': tuple_row_class, 'slots': slots_row_class}
+
+
+def make_row_factory(row_factory, fields: list):
+    """
+    根据row_factory得到构造单行的函数
+
+    Args:
+        row_factory: 'tuple' | 'slots' | 可调用对象（接收字段列表，返回接收一行tuple的函数）
+        fields: 字段列表
+    """
+    if callable(row_factory):
+        return row_factory(list(fields))
+    assert row_factory in ROW_FACTORIES, "row_factory must be 'tuple', 'slots' or callable"
+    return ROW_FACTORIES[row_factory](tuple(fields))
@@ -0,0 +1,124 @@
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+
+from loguru import logger
+
+from sqlman.core.v2.metrics import fingerprint
+from sqlman.core.v2.pool import Pool
+
+_EXPLAINABLE = re.compile(r'\s*(select|insert|replace|update|delete)\b', re.I)
+
+
+def args_shape(args) -> str | None:
+    """参数的形状（类型和数量，不含具体值），比如 'int*500, str'；executemany的参数为 '100 rows of (int, str)'"""
+    if not args:
+        return None
+    if isinstance(args, dict):
+        return ', '.join('{}: {}'.format(k, type(v).__name__) for k, v in args.items())
+    if isinstance(args[0], (list, tuple, dict)):
+        return '{} rows of ({})'.format(len(args), args_shape(args[0]))
+    runs = []
+    for v in args:
+        name = type(v).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return ', '.join(name if n == 1 else '{}*{}'.format(name, n) for name, n in runs)
+
+
+def explain_summary(plan) -> dict:
+    """从 EXPLAIN FORMAT=JSON 中提取全表扫描的表和用到的索引"""
+    full_scans, keys = [], []
+
+    def walk(node):
+        if isinstance(node, dict):
+            if 'access_type' in node:
+                if node['access_type'] == 'ALL':
+                    full_scans.append(node.get('table_name'))
+                if node.get('key'):
+                    keys.append(node['key'])
+            for v in node.values():
+                walk(v)
+        elif isinstance(node, list):
+            for v in node:
+                walk(v)
+
+    walk(plan)
+    return dict(full_scans=full_scans, keys=keys)
+
+
+class SlowLog:
+    """
+    慢语句记录：耗时超过threshold秒的语句记下指纹、参数形状、耗时，
+    按explain的比例抽样执行 EXPLAIN FORMAT=JSON，保存在环形缓冲区中，可选同时追加写入JSONL文件
+    """
+
+    def __init__(self, threshold: float = 1.0, explain: float = 0.1, size=1000, path: str = None):
+        """
+        Args:
+            threshold: 慢语句阈值（秒）
+            explain: 执行EXPLAIN的抽样比例，0为不执行，1为每条都执行
+            size: 环形缓冲区大小
+            path: JSONL文件路径，None为不写文件
+        """
+        self.threshold = threshold
+        self.explain = explain
+        self.path = path
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=size)
+
+    def capture(self, pool, sql: str, args, seconds: float, rows=0, error=False):
+        """记录一条慢语句，pool用于执行EXPLAIN"""
+        record = dict(
+            time=time.strftime('%Y-%m-%d %H:%M:%S'),
+            fingerprint=fingerprint(sql),
+            sql=sql if len(sql) <= 2000 else sql[:2000] + '...',
+            args=args_shape(args),
+            seconds=round(seconds, 6),
+            rows=rows,
+            error=error
+        )
+        many = bool(args) and isinstance(args, (list, tuple)) and isinstance(args[0], (list, tuple, dict))
+        if self.explain and not many and _EXPLAINABLE.match(sql) and random.random() < self.explain:
+            record.update(self._explain(pool, sql, args))
+        with self._lock:
+            self._records.append(record)
+            if self.path:
+                with open(self.path, 'a', encoding='utf8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+        logger.warning('慢语句 {:.3f}s  {}'.format(seconds, record['fingerprint']))
+
+    @staticmethod
+    def _explain(pool, sql: str, args) -> dict:
+        """
+        用单独的连接执行 EXPLAIN FORMAT=JSON（会话中的临时表在这个连接上不可见，失败时记录错误）\n
+        调用方此时还占着一个连接，所以不等待：没有空闲名额时放弃EXPLAIN，记录explain_error，避免名额用完时自己等自己
+        """
+        con, cur = None, None
+        try:
+            con = pool.connection(blocking=False) if isinstance(pool, Pool) else pool.connection()
+            cur = con.cursor()
+            cur.execute('explain format=json ' + sql, args=args or None)
+            plan = json.loads(cur.fetchone()[0])
+            return dict(explain=plan, **explain_summary(plan))
+        except Exception as e:
+            return dict(explain_error=str(e))
+        finally:
+            if cur:
+                cur.close()
+            if con:
+                con.close()
+
+    def records(self) -> list:
+        """缓冲区中的慢语句，从旧到新"""
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
@@ -1,19 +1,140 @@
+import os
+import random
+import tempfile
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
 
-from dbutils.pooled_db import PooledDB
 from loguru import logger
 
+from sqlman.core.v2.checkpoint import ScanProgress, make_checkpoint
+from sqlman.core.v2.throttle import Throttle
+from sqlman.core.v2.cache import ResultCache, get_cache, set_cache, setdefault_cache, copy_row, copy_result
 from sqlman.core.v2.db import MySQL
-from sqlman.tools import make_set, make_where, make_tail, check_items, print_lines
+from sqlman.core.v2.meta import MetaCache
+from sqlman.core.v2.pool import Pool
+from sqlman.tools import (
+    make_set, make_where, make_in, make_tail, check_items, print_lines,
+    split_range, prefetch, chunk_by_bytes, make_infile_line, make_columns,
+    make_row_cmp, encode_cursor, decode_cursor
+)
+
+
+def reads(func):
+    """读方法：配置了从库时在从库上执行（见Table._read_view）"""
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        return func(self._read_view(), *args, **kwargs)
+
+    return wrapper
 
 
 class Table(MySQL):
     """表格控制者"""
 
-    def __init__(self, name: str, pool: PooledDB, cfg: dict):
+    def __init__(self, name: str, pool: Pool, cfg: dict, db: MySQL = None):
         self.name = "`{}`".format(name)
         self._pool = pool
         self._cfg = cfg
+        self._meta = db._meta if db else MetaCache(self)
+        self._local = db._local if db else threading.local()
+        self._row_factory = db._row_factory if db else None
+        self._metrics = db._metrics if db else None
+        self._slow = db._slow if db else None
+        self._replicas = db._replicas if db else None
+        self._sticky = db._sticky if db else True
+        self._replica = None
+
+    @property
+    def schema(self) -> dict:
+        """表结构（字段、类型、索引），来自缓存"""
+        return self.get_schema(self.name)
+
+    @property
+    def columns(self) -> list:
+        """所有字段名"""
+        return self.schema['columns']
+
+    def _read_view(self):
+        """
+        配置了从库时，返回绑定到某个从库连接池的只读视图（同一张表），读方法在视图上执行\n
+        会话中且sticky为True、或者没有可用的从库时返回自己（主库）
+        """
+        if self._replicas is None or (self._sticky and self.in_session()):
+            return self
+        replica = self._replicas.pick()
+        if replica is None:
+            return self
+        view = Table(self.name.strip('`'), replica.pool, self._cfg, db=self)
+        view._local = threading.local()  # 不使用主库会话中固定的连接
+        view._replicas, view._replica_set, view._replica = None, self._replicas, replica
+        view._primary = self  # 要写入结果缓存的查询回到主库执行（见_cached）
+        return view
+
+    def enable_cache(self, ttl: float = 60, max_entries=1024, max_bytes=16 * 1024 * 1024) -> ResultCache:
+        """
+        开启query、query_count、exists的结果缓存（同一进程内这张表的所有Table对象共享）\n
+        通过本进程对这张表的写操作（insert_data、update*、delete、remove等）会自动使缓存失效，
+        其它进程或其它客户端的修改只能等ttl过期
+
+        Args:
+            ttl: 缓存有效秒数，None表示不过期
+            max_entries: 最多缓存多少条查询结果，超过时淘汰最久未使用的
+            max_bytes: 缓存结果的估算总字节数上限
+        """
+        cache = ResultCache(ttl=ttl, max_entries=max_entries, max_bytes=max_bytes)
+        set_cache(self._cache_key(self.name), cache)
+        return cache
+
+    def disable_cache(self):
+        """关闭结果缓存"""
+        set_cache(self._cache_key(self.name), None)
+
+    def cache_stats(self) -> dict | None:
+        """结果缓存的命中、未命中、淘汰次数等，未开启时返回None"""
+        cache = get_cache(self._cache_key(self.name))
+        return cache.stats() if cache else None
+
+    def _cached(self, sql: str, args, load, tag=None):
+        """
+        开启了结果缓存且不在会话中时，相同的SQL和参数直接返回缓存的结果；load(table)在table上查询，返回None表示查询失败，不缓存\n
+        从库视图上未命中时在主库查询再写入缓存：从库有延迟，写入后读到的旧数据会在缓存中一直留到过期
+        """
+        cache = get_cache(self._cache_key(self.name))
+        primary = self if self._replica is None else self._primary
+        if cache is None or primary.in_session():
+            return load(self)
+        key = (sql, tuple(args or ()), tag)
+        try:
+            hit, value = cache.get(key)
+        except TypeError:  # 参数不可哈希
+            return load(self)
+        if hit:
+            return copy_result(value)
+        generation = cache.generation
+        value = load(primary)
+        if value is not None:
+            cache.put(key, copy_result(value), generation)
+        return value
+
+    def _written(self, sql: str):
+        """通过这张表执行的写操作都使这张表的缓存失效"""
+        self._invalidate_cache(self.name)
+        target = self._write_target(sql)
+        if target and target != self.name.strip('`'):
+            self._invalidate_cache(target)
+
+    def stats(self, top: int = None) -> dict:
+        """这张表相关语句的指标（pool_wait、dealer等计时为整个MySQL实例的，见MySQL.stats）"""
+        stats = super().stats()
+        if 'statements' in stats:  # metrics=False时只有连接池的状态
+            name = self.name.lower()
+            statements = [(k, v) for k, v in stats['statements'].items() if name in k]
+            stats['statements'] = dict(statements[:top] if top else statements)
+        return stats
 
     def remove(self) -> bool:
         """删除这张表"""
@@ -31,6 +152,40 @@ class Table(MySQL):
         affect = self.exe_sql(sql, args=_args).affect
         return affect
 
+    def delete_bulk(self, once=1000, throttle: Throttle = None, **kwargs) -> int:
+        """
+        分批删除数据，每次 delete ... limit once，直到删除的行数不足once\n
+        注意：请限定条件进行删除
+
+        Args:
+            once: 每批删除的条数
+            throttle: 节流（见Throttle），限速、按耗时调整每批条数、复制延迟过高时暂停
+            **kwargs: 条件
+
+        Returns:
+            已删除的行数
+        """
+        _where, _args = make_where(kwargs)
+        affect = 0
+        while True:
+            limit = once if throttle is None else throttle.batch(once)
+            sql = 'delete from {} {}'.format(self.name, make_tail(_where, limit))
+            count = self._throttled(throttle, limit, lambda: self.exe_sql(sql, args=_args, allow_failed=False).affect)
+            affect += count
+            if count < limit:
+                return affect
+
+    @staticmethod
+    def _throttled(throttle: Throttle, rows: int, func):
+        """在节流下执行一批（throttle为None时直接执行）"""
+        if throttle is None:
+            return func()
+        throttle.pace(rows)
+        began = time.perf_counter()
+        result = func()
+        throttle.observe(time.perf_counter() - began)
+        return result
+
     def update(self, new: dict, limit: int = None, **kwargs) -> int:
         """更新数据"""
         _sql = "update {} set {} {}"
@@ -42,34 +197,197 @@ class Table(MySQL):
         affect = self.exe_sql(sql, args=args).affect
         return affect
 
-    def query(self, pick='*', limit: int = None, **kwargs) -> list:
-        """查询数据"""
+    def _make_query(self, pick='*', limit: int = None, **kwargs) -> tuple:
+        """生成查询SQL和参数"""
         if pick != '*' and pick.find(',') != -1:
             pick = ', '.join(["`{}`".format(f.strip().strip('`')) for f in pick.split(',') if f.strip()])
         _sql = "select {} from {} {}"
         _where, args = make_where(kwargs)
         tail = make_tail(_where, limit)
         sql = _sql.format(pick, self.name, tail)
-        data = self.exe_sql(sql, args=args, query_all=True).result
+        return sql, args
+
+    @reads
+    def query(
+            self, pick='*', limit: int = None, *, stream=False, format='rows', row_factory=None, where: dict = None,
+            **kwargs
+    ) -> list | dict:
+        """
+        查询数据
+
+        Args:
+            pick: 查询哪些字段
+            limit: 最多多少条
+            stream: 为True时返回生成器（见iter_query）
+            format: 'rows'返回[{}, {}]；以下返回列式 {字段: 值}，内存占用远小于rows：
+                'columns'每列为list，'arrays'数值列为array.array，'numpy'数值列为numpy数组（需要安装numpy）
+            row_factory: format为rows时每行的类型，'dict' | 'tuple' | 'slots'（见rows.py），默认同MySQL实例
+            where: 查询条件，字段名与参数同名（比如format）时放在这里
+            **kwargs: 查询条件
+        """
+        kwargs = dict(where or {}, **kwargs)
+        if stream:
+            return self.iter_query(pick, limit, where=kwargs)
+        sql, args = self._make_query(pick, limit, **kwargs)
+        if format != 'rows':
+            return self.exe_columns(sql, args=args, fmt=format)
+        data = self._cached(
+            sql, args, lambda t: t.exe_sql(sql, args=args, query_all=True, row_factory=row_factory).result,
+            tag=row_factory or self._row_factory
+        )
         return data
 
+    @reads
+    def iter_query(self, pick='*', limit: int = None, chunk: int = None, *, where: dict = None, **kwargs):
+        """
+        流式查询数据，逐行产出（chunk为None）或按chunk行分批产出，条件同query（字段名与参数同名时放在where中）
+
+        Examples:
+            for row in table.iter_query(age=18):
+                ...
+            for rows in table.iter_query(pick='id, name', chunk=5000):
+                ...
+        """
+        sql, args = self._make_query(pick, limit, **dict(where or {}, **kwargs))
+        return self.iter_sql(sql, args=args, chunk=chunk)
+
+    @reads
+    def paginate(
+            self, order_by: tuple | str = ('id',), page_size=100, after: str = None, pick='*', desc=False,
+            row_factory=None, **kwargs
+    ) -> dict:
+        """
+        按排序字段分页（keyset分页），用上一页返回的游标取下一页，\n
+        条件为 (a, b) > (上一页最后一行的a, b)，第1页和第10万页的代价相同，排序字段应有联合索引且组合唯一、不为NULL
+
+        Args:
+            order_by: 排序字段，比如 ('created_at', 'id') 或 'created_at, id'，最后一个字段通常用主键保证唯一
+            page_size: 每页行数
+            after: 上一页返回的next游标，None为第一页
+            pick: 查询哪些字段，会自动带上排序字段
+            desc: 是否倒序
+            row_factory: 每行的类型（见query）
+            **kwargs: 查询条件
+
+        Returns:
+            {'rows': 本页数据, 'next': 下一页的游标（没有下一页时为None）}
+
+        Examples:
+            page = table.paginate(order_by=('created_at', 'id'), page_size=50, status=1)
+            page = table.paginate(order_by=('created_at', 'id'), page_size=50, after=page['next'], status=1)
+        """
+        fields = [f.strip().strip('`') for f in order_by.split(',')] if isinstance(order_by, str) else list(order_by)
+        if pick != '*':
+            picked = [f.strip().strip('`') for f in pick.split(',')]
+            pick = ', '.join(['`{}`'.format(f) for f in picked + [f for f in fields if f not in picked]])
+        _where, args = make_where(kwargs)
+        conds = [_where] if _where else []
+        if after is not None:
+            conds.append(make_row_cmp(fields, '<' if desc else '>'))
+            args = args + decode_cursor(after, fields)
+        sql = 'select {} from {} {} order by {} limit {}'.format(
+            pick, self.name,
+            'where ' + ' and '.join(conds) if conds else '',
+            ', '.join('`{}` {}'.format(f, 'desc' if desc else 'asc') for f in fields),
+            page_size + 1  # 多取一行判断是否还有下一页
+        )
+        rows = self.exe_sql(sql, args=args, query_all=True, allow_failed=False, row_factory=row_factory).result
+        rows = list(rows or [])
+        if len(rows) <= page_size:
+            return dict(rows=rows, next=None)
+        rows = rows[:page_size]
+        return dict(rows=rows, next=encode_cursor(fields, [rows[-1][f] for f in fields]))
+
+    @reads
     def query_count(self, **kwargs) -> int:
         """查询数量"""
         _sql = "select count(1) from {} {}"
         _where, args = make_where(kwargs)
         tail = make_tail(_where)
         sql = _sql.format(self.name, tail)
-        count = self.exe_sql(sql, args=args, query_all=False).result["count(1)"]
+        count = self._cached(sql, args, lambda t: t.exe_sql(sql, args=args, query_all=False).result["count(1)"])
         return count
 
+    @reads
     def exists(self, **kwargs) -> bool:
         """检查数据是否存在"""
         _where, args = make_where(kwargs)
         sql = 'select 1 from {} where {} limit 1'.format(self.name, _where)
-        return self.exe_sql(sql, args=args).affect == 1
 
+        def load(table):
+            response = table.exe_sql(sql, args=args)
+            return response.affect == 1 if response.status else None
+
+        return bool(self._cached(sql, args, load))
+
+    def get(self, value, key='id', pick='*'):
+        """按主键（或唯一键）获取一行，不存在返回None（见get_many）"""
+        return self.get_many([value], key=key, pick=pick, as_dict=True).get(value)
+
+    @reads
+    def get_many(
+            self, keys: list, key='id', pick='*', chunk=1000, workers=1, as_dict=False, cache=True
+    ) -> dict | list:
+        """
+        按主键（或唯一键）批量获取\n
+        keys去重后先从进程内的LRU取，未命中的按chunk个一批 IN 查询；通过本进程对这张表的写操作会清空LRU
+
+        Args:
+            keys: 键值列表
+            key: 键字段
+            pick: 查询哪些字段，会自动带上key
+            chunk: 每次 IN 查询的键数量
+            workers: 线程数，大于1时多批并行查询，不超过连接池的maxconnections（会话中始终串行）
+            as_dict: 为True时返回 {键值: 行}（不含不存在的键），否则返回与keys顺序一致的列表，不存在的位置为None
+            cache: 是否使用LRU（会话中、从库上不使用：从库有延迟，读到的旧数据会在LRU中一直留到过期）
+
+        Examples:
+            users = table.get_many([3, 1, 2])  # [row3, row1, row2]
+            users = table.get_many(uids, key='uid', as_dict=True)  # {uid: row}
+        """
+        if pick != '*' and key not in [f.strip().strip('`') for f in pick.split(',')]:
+            pick = '{}, {}'.format(key, pick)
+        unique = list(dict.fromkeys(keys))
+        lru = None
+        if cache and not self.in_session() and self._replica is None:
+            lru = setdefault_cache(self._cache_key(self.name), 'rows', ttl=60, max_entries=100000)
+        found, misses = {}, unique
+        if lru is not None:
+            misses = []
+            for value in unique:
+                hit, row = lru.get((key, pick, value))
+                if hit:
+                    found[value] = copy_row(row)
+                else:
+                    misses.append(value)
+
+        if misses:
+            generation = lru.generation if lru is not None else None
+
+            def fetch(values: list) -> list:
+                sql, args = self._make_query(pick, **{key: values})
+                return self.exe_sql(sql, args=args, query_all=True, allow_failed=False).result or []
+
+            chunks = [misses[i:i + chunk] for i in range(0, len(misses), chunk)]
+            workers = min(workers, self._cfg.get('maxconnections') or workers, len(chunks))
+            if workers > 1 and not self.in_session():
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    batches = list(executor.map(fetch, chunks))
+            else:
+                batches = [fetch(values) for values in chunks]
+            for rows in batches:
+                for row in rows:
+                    found[row[key]] = row
+                    if lru is not None:
+                        lru.put((key, pick, row[key]), copy_row(row), generation)
+
+        if as_dict:
+            return {value: found[value] for value in unique if value in found}
+        return [found.get(value) for value in keys]
+
+    @reads
     def random(self, limit=1) -> dict | list:
-        """随机返回一条或多条数据"""
+        """随机返回一条或多条数据（从随机位置开始的连续几行，均匀采样请使用sample）"""
         sql = 'select * from {} where id >= (rand() * (select max(id) from {})) limit {}'.format(
             self.name,
             self.name,
@@ -78,6 +396,110 @@ class Table(MySQL):
         data = self.exe_sql(sql, query_all=limit).result
         return data
 
+    @reads
+    def sample(self, n=1, method='range', key: str = None, max_rounds=10, **kwargs) -> list:
+        """
+        均匀随机采样n条不重复的数据
+
+        range：在key的[min, max]中随机生成一批值，用一条 where key in (...) 查询命中的行，
+        落在空洞（或不满足条件）的值会按命中率补采下一轮，适合整数主键，min/max会被缓存\n
+        bernoulli：where rand() < p 全表扫描一次，p根据满足条件的行数估算，结果再随机截取n条\n
+        reservoir：流式读取所有满足条件的行做蓄水池抽样，严格均匀，适合过滤后的子集
+
+        Args:
+            n: 采样条数
+            method: 'range' | 'bernoulli' | 'reservoir'
+            key: range方式依据的字段，默认为单列主键，否则为id
+            max_rounds: range、bernoulli方式最多查询几轮
+            **kwargs: 过滤条件（同query）
+
+        Returns:
+            [{}, {}, ...]，满足条件的行不足n条（或range方式max_rounds轮内没有采够）时返回已采到的
+        """
+        assert method in ('range', 'bernoulli', 'reservoir'), "method must be 'range', 'bernoulli' or 'reservoir'"
+        if n <= 0:
+            return []
+
+        if method == 'reservoir':
+            reservoir = []
+            for i, row in enumerate(self.iter_query(where=kwargs)):
+                if i < n:
+                    reservoir.append(row)
+                elif (j := random.randrange(i + 1)) < n:
+                    reservoir[j] = row
+            return reservoir
+
+        if method == 'range':
+            if key is None:
+                primary = self.schema['primary']
+                key = primary[0] if len(primary) == 1 else 'id'
+            lo, hi = self._bounds(key)
+            if lo is None:
+                return []
+            if isinstance(lo, int) and isinstance(hi, int):
+                return self._sample_range(n, key, lo, hi, max_rounds, kwargs)
+            logger.warning('字段<{}>不是整数，改用bernoulli采样'.format(key))
+
+        total = self.query_count(**kwargs)
+        rate = min(1.0, (n * 1.2 + 10) / total) if total else 0
+        rows = []
+        for _ in range(max_rounds):
+            if not rate:
+                break
+            _where, args = make_where(kwargs)
+            sql = 'select * from {} where rand() < %s {}'.format(self.name, 'and ' + _where if _where else '')
+            rows = self.exe_sql(sql, args=[rate] + args, query_all=True).result or []
+            if len(rows) >= n or rate == 1.0:
+                break
+            rate = min(1.0, rate * 2)
+        return random.sample(rows, min(n, len(rows)))
+
+    def _bounds(self, key: str) -> tuple:
+        """字段的(min, max)，按元数据的有效期缓存"""
+        bounds = self._meta.state(self.name).setdefault('bounds', {})
+        hit = bounds.get(key)
+        if hit and self._meta.fresh(hit[0]):
+            return hit[1], hit[2]
+        sql = 'select min(`{}`), max(`{}`) from {}'.format(key, key, self.name)
+        lo, hi = self.exe_sql(sql, query_all=False, to_dict=False).result or (None, None)
+        bounds[key] = (time.time(), lo, hi)
+        return lo, hi
+
+    def _sample_range(self, n: int, key: str, lo: int, hi: int, max_rounds: int, filters: dict, once=10000) -> list:
+        """在[lo, hi]中随机探测key，每轮一条SQL"""
+        span = hi - lo + 1
+        picked = {}
+        tried = set()
+        rate = 1.0  # 探测命中率（累计）
+        size = 0
+        for _ in range(max_rounds):
+            need = n - len(picked)
+            left = span - len(tried)
+            if need <= 0 or left <= 0:
+                break
+            # 按命中率估算探测数量，上一轮不够时至少翻倍
+            size = min(left, once, max(need, int(need / rate * 1.5) + 1, size * 2))
+            if size == left:
+                probes = [v for v in range(lo, hi + 1) if v not in tried]
+            else:
+                probes = set()
+                while len(probes) < size:
+                    v = random.randint(lo, hi)
+                    if v not in tried:
+                        probes.add(v)
+                probes = list(probes)
+            tried.update(probes)
+
+            _where, args = make_where({**filters, key: probes})
+            sql = 'select * from {} where {}'.format(self.name, _where)
+            rows = self.exe_sql(sql, args=args, query_all=True).result or []
+            for row in rows:
+                picked[row[key]] = row
+            rate = (len(picked) + 1) / (len(tried) + 1)
+
+        rows = list(picked.values())
+        return random.sample(rows, n) if len(rows) > n else rows
+
     def update_one(self, item: dict, depend: str) -> int:
         """
         更新
@@ -101,13 +523,15 @@ class Table(MySQL):
         affect = self.exe_sql(sql, args=args).affect
         return affect
 
-    def update_many(self, items: list, depend: str) -> int:
+    def update_many(self, items: list, depend: str, throttle: Throttle = None, chunk=1000) -> int:
         """
         批量更新
 
         Args:
             items: 多条数据，每条数据含有<depend>字段
             depend: 条件判断的字段
+            throttle: 节流（见Throttle），传入时按批执行，每批条数以chunk为初始值
+            chunk: 节流时每批的条数
 
         Returns:
             已更新的行数
@@ -123,7 +547,14 @@ class Table(MySQL):
             vs = [one[k] for k in ks]
             vs.append(one[depend])
             args.append(vs)
-        affect = self.exem_sql(sql, args)
+        if throttle is None:
+            return self.exem_sql(sql, args)
+
+        affect, i = 0, 0
+        while i < len(args):
+            part = args[i:i + throttle.batch(chunk)]
+            affect += self._throttled(throttle, len(part), lambda: self.exem_sql(sql, part))
+            i += len(part)
         return affect
 
     def update_some(self, items: list, depend: str) -> int:
@@ -133,123 +564,585 @@ class Table(MySQL):
         keys = list(items[0].keys())
         keys.remove(depend)
 
-        head = 'update {} set'.format(self.name)
-
-        mid = ''
+        whens = ' '.join(['when %s then %s'] * len(items))
+        sets = []
         args = []
         for key in keys:
-            mid += '\t{} = case {}\n\t'.format(key, depend)
+            sets.append('`{}` = case `{}` {} end'.format(key, depend, whens))
             for data in items:
-                mid += 'when %s then %s '
                 args.append(data[depend])
                 args.append(data[key])
+
+        _in, args2 = make_in([data[depend] for data in items])
+        sql = 'update {} set {} where `{}` in {}'.format(self.name, ', '.join(sets), depend, _in)
+        affect = self.exe_sql(sql, args=args + args2).affect
+        return affect
+
+    def update_bulk(
+            self, items: list, depend: str, strategy='auto', chunk=5000, case_max=500, throttle: Throttle = None
+    ) -> int:
+        """
+        大批量更新\n
+        temp：数据分批写入会话临时表，再执行 update ... join 临时表，SQL长度与数据量无关\n
+        case：按case_max条一批执行update_some\n
+        不在会话中时每批提交一次，不会在整个过程中持有行锁，中途失败时之前的批次已经生效；
+        需要整体提交或回滚时在 session() 中调用
+
+        Args:
+            items: 多条数据，每条数据含有<depend>字段
+            depend: 条件判断的字段（建议有唯一索引）
+            strategy: 'case' | 'temp' | 'auto'（数据量不超过case_max时，根据同样规模下的历史耗时选择更快的方式）
+            chunk: temp方式每批写入临时表的条数
+            case_max: case方式每条SQL最多更新的条数
+            throttle: 节流（见Throttle），限速、按耗时调整每批条数（case方式不超过case_max）、复制延迟过高时暂停
+
+        Returns:
+            已更新的行数
+        """
+        if not items:
+            return 0
+        check_items(items, depend)
+        assert strategy in ('auto', 'case', 'temp'), "strategy must be 'auto', 'case' or 'temp'"
+
+        costs = self._meta.state(self.name).setdefault('update_costs', {})  # 不超过case_max条时每条数据的平均耗时
+        if strategy == 'auto':
+            if len(items) > case_max:
+                strategy = 'temp'
             else:
-                mid += 'end,\n'
-        mid = mid[:-2]
+                strategy = min(('case', 'temp'), key=lambda k: costs.get(k, 0))  # 没测过的优先试一次
 
-        values = ["'{}'".format(data[depend]) for data in items]
-        tail = 'where {} in ({})'.format(depend, ', '.join(values))
+        began = time.time()
+        if strategy == 'case':
+            affect, i = 0, 0
+            while i < len(items):
+                part = items[i:i + (case_max if throttle is None else min(case_max, throttle.batch(case_max)))]
+                affect += self._throttled(throttle, len(part), lambda: self.update_some(part, depend))
+                i += len(part)
+        else:
+            affect = self._update_by_temp(items, depend, chunk, throttle)
+        if len(items) <= case_max:  # 只有这个规模需要选择，更大的批次会摊薄temp方式建表、删表的固定开销
+            cost = (time.time() - began) / len(items)
+            costs[strategy] = cost if strategy not in costs else costs[strategy] * 0.8 + cost * 0.2
+        return affect
 
-        sql = '\n'.join([head, mid, tail])
-        affect = self.exe_sql(sql, args=args).affect
+    def _update_by_temp(self, items: list, depend: str, chunk: int, throttle: Throttle = None) -> int:
+        """通过会话临时表JOIN批量更新"""
+        keys = [k for k in items[0] if k != depend]
+        if not keys:
+            return 0
+        fields = [depend] + keys
+        tmp = '`tmp_{}_{}`'.format(self.name.strip('`'), uuid.uuid4().hex[:8])
+        columns = ', '.join('`{}`'.format(k) for k in fields)
+        upsert = ', '.join('`{}`=values(`{}`)'.format(k, k) for k in keys)  # depend重复时后面的覆盖前面的
+        sets = ', '.join('t.`{}` = s.`{}`'.format(k, k) for k in keys)
+
+        affect = 0
+        nested = self.in_session()
+        with self.session():  # 临时表只在当前连接可见
+            sql = 'create temporary table {} (primary key (`{}`)) select {} from {} limit 0'.format(
+                tmp, depend, columns, self.name
+            )
+            self.exe_sql(sql)
+            sql = 'update {} t join {} s using (`{}`) set {}'.format(self.name, tmp, depend, sets)
+
+            def run(rows: list) -> int:
+                self._add_many(tmp, rows, update=upsert)
+                count = self.exe_sql(sql).affect
+                self.exe_sql('delete from {}'.format(tmp))
+                return count
+
+            try:
+                i = 0
+                while i < len(items):
+                    size = chunk if throttle is None else throttle.batch(chunk)
+                    rows = [{k: one[k] for k in fields} for one in items[i:i + size]]
+                    affect += self._throttled(throttle, len(rows), lambda: run(rows))
+                    i += len(rows)
+                    if not nested:  # 每批提交，外层会话则由外层统一提交
+                        self._local.con.commit()
+            finally:
+                self.exe_sql('drop temporary table if exists {}'.format(tmp))
         return affect
 
+    @reads
     def get_min(self, field: str):
         """获取字段的最小值"""
         sql = 'select min({}) from {}'.format(field, self.name)
         min_value = self.exe_sql(sql, query_all=False, to_dict=False).result[0]
         return min_value
 
+    @reads
     def get_max(self, field: str):
         """获取字段的最大值"""
         sql = 'select max({}) from {}'.format(field, self.name)
         max_value = self.exe_sql(sql, query_all=False, to_dict=False).result[0]
         return max_value
 
+    @reads
+    def split_ranges(self, field='id', parts=4, add_cond=None) -> list:
+        """
+        按行数把字段切成多个区间，每个区间的行数大致相等（适合id稀疏、聚集的表）
+
+        在排序字段的索引上按 count/parts 的间隔取边界值（limit offset, 2），
+        重复值不会被拆到两个区间
+
+        Args:
+            field: 进行切分的字段（有索引）
+            parts: 期望切成几份
+            add_cond: 补充的SQL条件
+
+        Returns:
+            [(lo, hi), (lo, hi), ...]，闭区间，可以直接传给scan的ranges参数
+        """
+        where = 'where {} is not null {}'.format(field, '' if add_cond is None else 'and ' + add_cond)
+        sql = 'select count(1), min({}), max({}) from {} {}'.format(field, field, self.name, where)
+        total, lo, end = self.exe_sql(sql, query_all=False, to_dict=False).result
+        if not total:
+            return []
+
+        parts = max(1, min(parts, total))
+        ranges = []
+        for k in range(1, parts):
+            offset = total * k // parts
+            sql = 'select {} from {} {} order by {} limit {}, 2'.format(field, self.name, where, field, offset - 1)
+            rows = self.exe_sql(sql, query_all=True, to_dict=False).result
+            if len(rows) < 2 or rows[0][0] == rows[1][0]:  # 边界落在重复值上，不拆
+                continue
+            ranges.append((lo, rows[0][0]))
+            lo = rows[1][0]
+        ranges.append((lo, end))
+        return ranges
+
+    def _scan_keys(self, sort_field) -> list:
+        """
+        scan的排序字段列表：sort_field可以是字段、'a, b' 或元组\n
+        字段组合不唯一时自动补上主键字段，保证批次边界上的重复值不会被跳过
+        """
+        if isinstance(sort_field, str):
+            keys = [f.strip().strip('`') for f in sort_field.split(',') if f.strip()]
+        else:
+            keys = [f.strip('`') for f in sort_field]
+        schema = self.schema
+        if not any(set(cols) <= set(keys) for cols in schema['unique'].values()):
+            if schema['primary']:
+                keys += [f for f in schema['primary'] if f not in keys]
+            else:
+                logger.warning('{} 排序字段 {} 不唯一且没有主键，批次边界上的重复值可能被跳过'.format(self.name, keys))
+        return keys
+
+    def _iter_range(self, start, end, opts: dict, tag='', after=None, state: dict = None):
+        """
+        逐批查询第一个排序字段的闭区间 [start, end]，after不为None时从排序字段值after之后开始，
+        每次产出 (一批数据, 行数, 最后一行的排序字段值)；读到区间末尾时把state['done']设为True（达到max_query_times提前结束时不设）\n
+        每批的条件为 (a, b) > (上一批最后一行的a, b)，按 a, b 排序，是索引上的范围读取
+        """
+        if opts['mode'] == 'deferred':
+            yield from self._iter_deferred(start, end, opts, tag, after, state)
+            return
+
+        keys, once, throttle = opts['keys'], opts['once'], opts['throttle']
+        add_cond, log = opts['add_cond'], opts['log']
+        to_dict = opts['format'] == 'rows'
+        lead = '`{}`'.format(keys[0])
+        order = ', '.join('`{}`'.format(k) for k in keys)
+        show = (lambda v: v[0]) if len(keys) == 1 else (lambda v: v)  # 日志中单个字段不显示为元组
+
+        times = 0  # 查询了多少次
+        last = None if after is None else tuple(after)  # 上一批最后一行的排序字段值
+        while True:
+            limit = once if throttle is None else throttle.batch(once)  # 节流时批大小随反馈变化
+            conds, args = ['{} >= %s and {} <= %s'.format(lead, lead)], [start, end]
+            if last is not None:
+                conds.append(make_row_cmp(keys, '>'))
+                args += list(last)
+            if add_cond is not None:
+                conds.append('({})'.format(add_cond))
+            if opts['mode'] == 'join':  # 延迟关联：子查询只沿索引取这一批的键，再回表取完整的行
+                sql = 'select {} from {} t join (select {} from {} where {} order by {} limit {}) d using ({}) order by {}'
+                sql = sql.format(
+                    opts['joined'], self.name, order, self.name, ' and '.join(conds), order, limit, order,
+                    ', '.join('t.`{}`'.format(k) for k in keys)
+                )
+            else:
+                sql = 'select {} from {} where {} order by {} limit {}'.format(
+                    opts['pick'], self.name, ' and '.join(conds), order, limit
+                )
+
+            if throttle is not None:
+                throttle.pace(limit)
+            began = time.perf_counter()
+            response = self.exe_sql(sql, args=args, query_all=True, to_dict=to_dict)
+            if throttle is not None:
+                throttle.observe(time.perf_counter() - began)
+            result: list = response.result
+            if not result:
+                if tag or last is not None:  # 分片为空是正常的（比如id被删除出空洞）
+                    if log is True:
+                        logger.info('{}查询为空'.format(tag))
+                else:
+                    self.panic(sql, '查询为空')
+                if state is not None:
+                    state['done'] = True
+                return
+
+            index = keys if to_dict else [response.columns.index(k) for k in keys]
+            origin = start if last is None else show(last)
+            first, last = tuple(result[0][i] for i in index), tuple(result[-1][i] for i in index)
+
+            # 输出查询日志
+            if log is True:
+                params = tag, order, origin, limit, len(result), show(first), show(last)
+                logger.info('{}{} 从{}  期望{}得到{}  具体{}到{}'.format(*params))
+
+            yield result if to_dict else make_columns(result, response.columns, opts['format']), len(result), last
+            if len(result) < limit:
+                if state is not None:
+                    state['done'] = True
+                return
+
+            times += 1
+            if opts['max_query_times'] and times >= opts['max_query_times']:  # 达到最大查询次数了
+                return
+
+            if throttle is None:
+                time.sleep(opts['rest'])  # 每一轮查询之间的间隔
+
+    def _iter_deferred(self, start, end, opts: dict, tag='', after=None, state: dict = None):
+        """
+        deferred：先沿索引只查排序字段（覆盖索引，add_cond也在这一步），再按这批键 IN 查询完整的行，
+        后台线程同时查询下一批键；产出与_iter_range相同
+        """
+        keys = opts['keys']
+        order = ', '.join('`{}`'.format(k) for k in keys)
+        key_opts = dict(opts, mode='eager', pick=order, format='rows')
+        batches = prefetch(self._iter_range(start, end, key_opts, tag, after, state), 1)
+        try:
+            for key_rows, _, last in batches:
+                if len(keys) == 1:
+                    _in, args = make_in([row[keys[0]] for row in key_rows])
+                    cond = '`{}` in {}'.format(keys[0], _in)
+                else:
+                    one = '({})'.format(', '.join(['%s'] * len(keys)))
+                    cond = '({}) in ({})'.format(order, ', '.join([one] * len(key_rows)))
+                    args = [row[k] for row in key_rows for k in keys]
+                sql = 'select {} from {} where {} order by {}'.format(opts['pick'], self.name, cond, order)
+                to_dict = opts['format'] == 'rows'
+                response = self.exe_sql(sql, args=args, query_all=True, to_dict=to_dict)
+                result = response.result or []  # 两次查询之间被删除的行不再返回
+                yield result if to_dict else make_columns(result, response.columns, opts['format']), len(result), last
+        finally:
+            batches.close()
+
+    def _scan_range(
+            self, start, end, dealer, opts: dict, tag='', progress: ScanProgress = None, index=0
+    ) -> dict:
+        """扫描闭区间 [start, end]，返回这个区间的统计信息；progress不为None时从检查点继续，并在每批之后保存进度"""
+        stats = dict(start=start, end=end, rows=0, batches=0, elapsed=0.0)
+        began = time.time()
+        after = None
+        if progress is not None:
+            shard = progress.shard(index)
+            if shard['done']:
+                stats.update(skipped=True)
+                return stats
+            after = shard['last']
+            stats.update(resumed_after=after)
+
+        state = dict(done=False)
+        batches = self._iter_range(start, end, opts, tag, after, state)
+        if opts['prefetch']:  # 后台线程提前查询下一批，查询与dealer并行
+            batches = prefetch(batches, opts['prefetch'])
+        try:
+            for result, count, last in batches:
+                # 查询出来的数据交给回调函数处理
+                dealt = time.perf_counter()
+                dealer(result)
+                if self._metrics is not None:
+                    self._metrics.timing('dealer', time.perf_counter() - dealt)
+                if progress is not None:
+                    progress.advance(index, last, count)
+                stats['rows'] += count
+                stats['batches'] += 1
+        finally:
+            batches.close()
+        if progress is not None and state['done']:  # 达到max_query_times提前结束时保留进度，下次从这里继续
+            progress.finish(index)
+
+        stats['elapsed'] = time.time() - began
+        return stats
+
+    @reads
     def scan(
-            self, sort_field='id', pick='*',
-            start: int = None, end: int = None,
+            self, sort_field: str | tuple = 'id', pick='*',
+            start=None, end=None,
             dealer=None, add_cond=None,
             once=1000, rest=0.05,
-            max_query_times=None, log=True
-    ):
+            max_query_times=None, log=True,
+            workers=1, serial=False, ranges: list = None,
+            prefetch=0, format='rows', checkpoint=None, throttle: Throttle = None, mode='eager'
+    ) -> dict:
         """
         扫描数据，每一批数据可以交给回调函数处理
 
         Args:
-            sort_field: 进行排序的字段（数值型、有索引）
-            pick: 查询哪些字段
-            start: 排序字段的最小值
-            end: 排序字段的最大值
+            sort_field: 排序字段（有索引），可以是字符串等非数值字段，也可以是多个字段 ('a', 'b') 或 'a, b'（联合索引），
+                字段组合不唯一时自动补上主键字段
+            pick: 查询哪些字段，会自动带上排序字段
+            start: 第一个排序字段的最小值（包含）
+            end: 第一个排序字段的最大值（包含）
             add_cond: 补充的SQL条件
             once: 每一批查询多少条
             rest: 每一批查询的间隔
             dealer: 每一批数据的回调函数
             log: 是否输出查询日志
-            max_query_times: 最大查询次数
-        """
+            max_query_times: 最大查询次数（多线程时为每个分片的最大查询次数）
+            workers: 线程数，大于1时把第一个排序字段的区间切成多个分片并行扫描（整数均分，其它类型按行数切分），
+                不超过连接池的maxconnections
+            serial: 多线程时是否串行调用dealer（dealer非线程安全时使用）
+            ranges: 指定分片 [(lo, hi), ...]（比如split_ranges的结果），此时忽略start、end
+            prefetch: 后台预取的批数，大于0时下一批的查询与dealer并行执行
+            format: 每一批数据的格式，'rows'为[{}, {}]，'columns' | 'arrays' | 'numpy'为列式 {字段: 值}（见query）
+            checkpoint: 检查点，本地文件路径或TableCheckpoint（多台机器接着执行），每次dealer成功后保存每个分片的进度，
+                中断后用同样的参数重新执行会从保存的位置继续（分片沿用第一次的划分），全部分片读到末尾后清除（max_query_times提前结束不算）；
+                至少一次：保存进度前中断的那一批会再交给dealer一次
+            throttle: 节流（见Throttle），限速、按查询耗时调整每批条数（以once为初始值）、复制延迟过高时暂停，此时忽略rest
+            mode: 'eager'按排序字段范围直接查询pick；pick含大字段的宽表可以使用：
+                'deferred'先沿索引只查这一批的排序字段（add_cond最好只涉及索引字段，走覆盖索引），
+                再按键 IN 查询完整的行，同时后台线程查询下一批键；
+                'join'延迟关联，一条语句 select ... join (只查键的子查询) using (排序字段)
 
-        times = 0  # 查询了多少次
+        Returns:
+            {'rows': 总行数, 'batches': 总批数, 'elapsed': 总耗时, 'shards': [每个分片的统计信息]}
+        """
+        assert mode in ('eager', 'deferred', 'join'), "mode must be 'eager', 'deferred' or 'join'"
         dealer = dealer or print_lines  # 具体的回调函数
-        start, end = start or self.get_min(sort_field), end or self.get_max(sort_field)  # 查询区间
+        keys = self._scan_keys(sort_field)
+        joined = 't.*'
+        if pick != '*':
+            picked = [f.strip().strip('`') for f in pick.split(',')]
+            picked += [k for k in keys if k not in picked]
+            pick = ', '.join(['`{}`'.format(f) for f in picked])
+            joined = ', '.join(['t.`{}`'.format(f) for f in picked])
+        opts = dict(mode=mode, joined=joined,
+            keys=keys, pick=pick, add_cond=add_cond, once=once, rest=rest, throttle=throttle,
+            max_query_times=max_query_times, log=log, prefetch=prefetch, format=format
+        )
+        maxconnections = self._cfg.get('maxconnections')
+        if maxconnections:
+            workers = min(workers, maxconnections)
 
-        first_query = True  # 第一次查询
-        while True:
-            symbol, cond = '>=' if first_query else '>', '' if add_cond is None else 'and ' + add_cond
-            sql = '''
-                select {} from {}
-                where {} {} {} and {} <= {} {}
-                order by {}
-                limit {}
-            '''.format(
-                pick, self.name,
-                sort_field, symbol, start, sort_field, end, cond,
-                sort_field,
-                once
-            )
+        progress = None
+        if checkpoint is not None:
+            progress = ScanProgress(make_checkpoint(checkpoint), self.name.strip('`'), keys)
+            if progress.resumed:
+                ranges = progress.ranges
+                if log is True:
+                    logger.info('{} 从检查点继续扫描，已处理 {} 条'.format(self.name, sum(
+                        s['rows'] for s in progress.state['shards']
+                    )))
 
-            result: list = self.exe_sql(sql, query_all=True).result
-            if not result:
-                self.panic(sql, '查询为空')
-                return
+        if ranges is None:
+            bounded = start is not None or end is not None
+            start = self.get_min(keys[0]) if start is None else start  # 查询区间
+            end = self.get_max(keys[0]) if end is None else end
+            if start is None or end is None:
+                return dict(rows=0, batches=0, elapsed=0.0, shards=[])
+            if workers > 1 and isinstance(start, int) and isinstance(end, int):
+                ranges = split_range(start, end, workers)
+            elif workers > 1 and not bounded:  # 非整数字段按行数切分
+                ranges = self.split_ranges(keys[0], workers, add_cond)
+            else:
+                ranges = [(start, end)]
+        if not ranges:
+            return dict(rows=0, batches=0, elapsed=0.0, shards=[])
+        if progress is not None and not progress.resumed:
+            progress.begin(ranges)
 
-            # 输出查询日志
-            if log is True:
-                params = sort_field, symbol, start, once, len(result), result[0][sort_field], result[-1][sort_field]
-                logger.info('{}{}{}  期望{}得到{}  具体{}到{}'.format(*params))
+        began = time.time()
+        if len(ranges) == 1:
+            lo, hi = ranges[0]
+            shards = [self._scan_range(lo, hi, dealer, opts, progress=progress)]
+        else:
+            if serial and workers > 1:
+                lock = threading.Lock()
+                _dealer = dealer
 
-            # 查询出来的数据交给回调函数处理
-            if len(result) == once:
-                dealer(result)
-                start = result[-1][sort_field]
-                if start == end:
-                    break
-            else:
-                dealer(result)
-                break
+                def dealer(lines):
+                    with lock:
+                        _dealer(lines)
 
-            times += 1
-            if max_query_times and times >= max_query_times:  # 达到最大查询次数了
-                break
+            with ThreadPoolExecutor(max_workers=min(workers, len(ranges))) as executor:
+                futures = [
+                    executor.submit(
+                        self._scan_range, lo, hi, dealer, opts, '[{}/{}] '.format(i + 1, len(ranges)), progress, i
+                    )
+                    for i, (lo, hi) in enumerate(ranges)
+                ]
+                shards = [f.result() for f in futures]
+        if progress is not None:
+            progress.complete()
 
-            first_query = False
-            time.sleep(rest)  # 每一轮查询之间的间隔
+        return dict(
+            rows=sum(s['rows'] for s in shards),
+            batches=sum(s['batches'] for s in shards),
+            elapsed=time.time() - began,
+            shards=shards
+        )
 
-    def insert_data(self, data: dict | list, update: str = None, unique: str = None) -> int:
+    def insert_data(
+            self, data: dict | list, update: str = None, unique: str = None,
+            chunk_bytes: int = None, commit='chunk', retry=1, report=False, throttle: Throttle = None
+    ) -> int | list:
         """
-        插入数据，dict插入一条，list插入多条
+        插入数据，dict插入一条，list插入多条\n
+        list会按估算的编码字节数自动分批执行，每批不超过max_allowed_packet的一半（或chunk_bytes）
 
         Args:
              data: {} | [{}, {}, {}]
              update: 更新
              unique: 唯一索引
+             chunk_bytes: 每批的最大字节数
+             commit: 'chunk'每批提交一次，失败的批次单独重试、报告；'once'所有批次在一个事务中，任何一批失败则全部回滚
+             retry: 每批失败后的重试次数（commit='chunk'时有效）
+             report: 是否返回每批的报告
+             throttle: 节流（见Throttle），限速、按耗时调整每批条数（不超过字节数限制）、复制延迟过高时暂停
 
         Returns:
-            已插入的行数
+            已插入的行数；report为True时返回 [{'rows', 'bytes', 'affect', 'elapsed', 'attempts', 'error'}, ...]
         """
         if isinstance(data, dict):
             return super()._add_one(self.name, data, update, unique)
-        return super()._add_many(self.name, list(data), update, unique)
+        items = list(data)
+        reports = self._insert_chunks(items, update, unique, chunk_bytes, commit, retry, throttle) if items else []
+        return reports if report else sum(r['affect'] for r in reports)
+
+    def _insert_chunks(self, items: list, update, unique, chunk_bytes, commit, retry, throttle=None) -> list:
+        """分批插入，返回每批的报告"""
+        assert commit in ('chunk', 'once'), "commit must be 'chunk' or 'once'"
+        budget = chunk_bytes or (self._meta.variable('max_allowed_packet') or 4 * 1024 * 1024) // 2
+        once = commit == 'once'
+        reports = []
+
+        def chunks():
+            """按字节数分批，节流时再按当前的批大小切分"""
+            for chunk, size in chunk_by_bytes(items, budget):
+                if throttle is None:
+                    yield chunk, size
+                    continue
+                i = 0
+                while i < len(chunk):
+                    part = chunk[i:i + throttle.batch(len(chunk))]
+                    yield part, size * len(part) // len(chunk)
+                    i += len(part)
+
+        def run(chunk: list, size: int) -> dict:
+            one = dict(rows=len(chunk), bytes=size, affect=0, elapsed=0.0, attempts=0, error=None)
+            reports.append(one)
+            while True:
+                one['attempts'] += 1
+                began = time.time()
+                try:
+                    one['affect'] = self._throttled(
+                        throttle, len(chunk), lambda: self._add_many(self.name, chunk, update, unique, allow_failed=False)
+                    )
+                    one['error'] = None
+                    return one
+                except Exception as e:
+                    one['error'] = str(e)
+                    if once or one['attempts'] > retry:
+                        return one
+                finally:
+                    one['elapsed'] += time.time() - began
+
+        if not once:
+            for chunk, size in chunks():
+                run(chunk, size)
+            return reports
+
+        nested = self.in_session()
+        try:
+            with self.session():
+                for chunk, size in chunks():
+                    if run(chunk, size)['error']:
+                        raise RuntimeError(reports[-1]['error'])
+        except RuntimeError:
+            if nested:  # 外层会话负责回滚
+                raise
+            for one in reports:  # 已整体回滚
+                one['affect'] = 0
+        return reports
+
+    def bulk_load(self, rows, columns: list = None, batch=100000) -> int:
+        """
+        使用 LOAD DATA LOCAL INFILE 批量导入数据，适合百万级以上的数据量\n
+        数据每batch行写入一个临时文件再导入，内存占用与总行数无关；需要连接参数 local_infile=True，
+        客户端或服务端未开启local_infile时，自动退回到分批insert（同一个MySQL实例只检查、提示一次）
+
+        Args:
+            rows: 可迭代对象，元素为dict，或按columns顺序排列的tuple/list
+            columns: 字段列表，默认取第一条dict的键，元素不是dict时默认为表的所有字段
+            batch: 每个临时文件包含的行数
+
+        Returns:
+            已导入的行数
+        """
+        total = 0
+        buffer = []
+
+        def flush():
+            nonlocal total
+            if self._load_data_enabled():
+                try:
+                    total += self._load_file(columns, buffer)
+                    return
+                except Exception as e:
+                    if getattr(e, 'args', (None,))[0] not in (1148, 2068, 3948):  # local_infile未开启
+                        raise e
+                    self._meta.features['load_data'] = False
+                    logger.warning('local_infile未开启，退回到分批insert：{}'.format(e))
+            items = [row if isinstance(row, dict) else dict(zip(columns, row)) for row in buffer]
+            total += self.insert_data(items)
+
+        for row in rows:
+            if columns is None:
+                columns = list(row) if isinstance(row, dict) else self.columns
+            buffer.append(row)
+            if len(buffer) >= batch:
+                flush()
+                buffer = []
+        if buffer:
+            flush()
+        return total
+
+    def _load_data_enabled(self) -> bool:
+        """客户端和服务端是否都开启了local_infile，结果记在MySQL实例上，不可用时只提示一次"""
+        enabled = self._meta.features.get('load_data')
+        if enabled is None:
+            enabled = bool(self._cfg.get('local_infile')) and self._meta.variable('local_infile') in (1, '1', 'ON')
+            self._meta.features['load_data'] = enabled
+            if not enabled:
+                logger.warning('客户端或服务端未开启local_infile，bulk_load退回到分批insert')
+        return enabled
+
+    def _load_file(self, columns: list, rows: list) -> int:
+        """把rows写入临时文件，再用 LOAD DATA LOCAL INFILE 导入"""
+        binary = False  # 有bytes值时按binary导入，不做字符集转换
+        with tempfile.NamedTemporaryFile('wb', suffix='.tsv', delete=False) as f:
+            for row in rows:
+                values = [row.get(c) for c in columns] if isinstance(row, dict) else row
+                binary = binary or any(isinstance(v, (bytes, bytearray)) for v in values)
+                f.write(make_infile_line(values))
+        try:
+            sql = '''
+                load data local infile %s into table {}
+                character set {}
+                fields terminated by '\\t' escaped by '\\\\'
+                lines terminated by '\\n'
+                ({})
+            '''.format(self.name, 'binary' if binary else 'utf8mb4', ', '.join('`{}`'.format(c) for c in columns))
+            return self.exe_sql(sql, args=[f.name], allow_failed=False).affect
+        finally:
+            os.remove(f.name)
 
     def cvs(self, field: str, values: list) -> tuple:
         """
@@ -267,18 +1160,86 @@ class Table(MySQL):
         new = list(set(values) - set(old))
         return new, old
 
-    def dedup_insert_data(self, items: list, dedup: str) -> int:
+    def dedup_insert_data(self, items: list, dedup: str, mode='auto', chunk=1000, detail=False) -> int | dict:
         """
         去重版插入数据
 
+        index：依赖<dedup>字段的唯一索引，每批一条 INSERT ... ON DUPLICATE KEY UPDATE，由数据库判重（按列类型和排序规则比较），
+        插入的行数来自影响行数；detail为True时，一批中既有新值又有已存在的值才需要区分：撤销这一批，读一次已存在的值再插入其余的，
+        插入的行数对不上（读和插入之间被并发写入了同样的值，或者与其他唯一索引冲突）时再撤销，逐行插入\n
+        query：先查询已存在的值，再插入不存在的数据（有并发竞争）\n
+        index方式的限制：并发写入同样的值时唯一索引保证只插入一次，但互相重叠的多行插入在InnoDB中仍可能死锁（1213），
+        该批抛出异常，需要调用方重试；与其他唯一索引冲突的行不会插入，算作已存在
+
         Args:
             items: [{}, {}, {}]
             dedup: 进行去重的字段
+            mode: 'index' | 'query' | 'auto'（<dedup>字段有单列唯一索引时使用index，否则使用query）
+            chunk: index方式每批插入的条数
+            detail: 是否返回详细结果
 
         Returns:
-            已插入的行数
+            已插入的行数；detail为True时返回 {'affect': 已插入的行数, 'new': [新插入的值], 'old': [已存在的值]}
         """
-        vs = [item[dedup] for item in items]
-        nv, ov = self.cvs(field=dedup, values=vs)
-        items2 = [a for a in items if a[dedup] in nv]
-        return self.insert_data(items2, unique=dedup) if items2 else 0
+        if mode == 'auto':
+            mode = 'index' if [dedup] in self.schema['unique'].values() else 'query'
+        assert mode in ('index', 'query'), "mode must be 'index', 'query' or 'auto'"
+
+        if mode == 'query':
+            vs = [item[dedup] for item in items]
+            nv, ov = self.cvs(field=dedup, values=vs) if vs else ([], [])
+            items2 = [a for a in items if a[dedup] in nv]
+            affect = self.insert_data(items2, unique=dedup) if items2 else 0
+            return dict(affect=affect, new=nv, old=ov) if detail else affect
+
+        # 同一批数据中重复的值只保留第一条
+        unique = {}
+        for a in items:
+            unique.setdefault(a[dedup], a)
+        items = list(unique.values())
+
+        affect, new, old = 0, [], []
+        for i in range(0, len(items), chunk):
+            part = items[i:i + chunk]
+            if not detail:
+                affect += self._add_many(self.name, part, unique=dedup, allow_failed=False)
+                continue
+            fresh = self._dedup_chunk(part, dedup)
+            affect += len(fresh)
+            new += [part[j][dedup] for j in fresh]
+            old += [a[dedup] for j, a in enumerate(part) if j not in fresh]
+        return dict(affect=affect, new=new, old=old) if detail else affect
+
+    def _dedup_chunk(self, part: list, field: str) -> set:
+        """插入一批数据（重复的<field>不插入），返回新插入的序号"""
+        nested = self.in_session()
+        with self.session():
+            if nested:  # 外层会话不能整体回滚，用保存点撤销这一批
+                self.exe_sql('savepoint sqlman_dedup', allow_failed=False)
+            line = self._add_many(self.name, part, unique=field, allow_failed=False)
+            if line in (0, len(part)):
+                return set(range(len(part))) if line else set()
+
+            self._undo(nested)
+            found = self._existing(part, field)
+            fresh = [j for j in range(len(part)) if j not in found]
+            if not fresh or self._add_many(self.name, [part[j] for j in fresh], unique=field, allow_failed=False) == len(fresh):
+                return set(fresh)
+
+            self._undo(nested)
+            return {j for j in range(len(part)) if self._add_many(self.name, [part[j]], unique=field, allow_failed=False)}
+
+    def _undo(self, nested: bool):
+        """撤销会话中这一批的插入"""
+        if nested:
+            self.exe_sql('rollback to savepoint sqlman_dedup', allow_failed=False)
+        else:
+            self._local.con.rollback()
+
+    def _existing(self, items: list, field: str) -> set:
+        """items中<field>的值已存在于表中的序号，由数据库按列类型比较"""
+        rows = ' union all '.join(['select %s as i, %s as v'] * len(items))
+        sql = 'select distinct d.i from ({}) d join {} t on t.`{}` = d.v'.format(rows, self.name, field)
+        args = [x for j, a in enumerate(items) for x in (j, a[field])]
+        result = self.exe_sql(sql, args=args, query_all=True, to_dict=False).result
+        return {row[0] for row in result}
@@ -0,0 +1,154 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """令牌桶：每秒补充rate个令牌，最多攒burst秒的量；令牌不够时预支，由调用方睡眠等待"""
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        assert rate > 0, "rate must be positive"
+        self.rate = rate
+        self.capacity = rate * burst
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, n: float) -> float:
+        """取n个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+def replication_lag(db) -> float | None:
+    """
+    从库的复制延迟（秒），依次尝试 SHOW REPLICA STATUS、SHOW SLAVE STATUS（MySQL 8.0.22 以前）\n
+    不是从库或复制线程未运行时返回None
+    """
+    for sql, field in (('show replica status', 'Seconds_Behind_Source'), ('show slave status', 'Seconds_Behind_Master')):
+        try:
+            row = db.exe_sql(sql, query_all=False, allow_failed=False).result
+        except Exception:
+            continue
+        if not row or row.get(field) is None:
+            return None
+        return float(row[field])
+    return None
+
+
+class Throttle:
+    """
+    批量操作的节流，可用于scan、insert_data、update_many、update_bulk、delete_bulk\n
+    令牌桶限制每秒行数、每秒语句数；每批耗时超过target_latency时批大小减半，明显低于时逐步增大；
+    从库复制延迟超过max_lag时暂停，直到延迟恢复\n
+    同一个Throttle可以在多个线程、多个任务之间共享，共同遵守限速
+    """
+
+    def __init__(
+            self, rows_per_sec: float = None, statements_per_sec: float = None,
+            target_latency: float = None, max_lag: float = None, lag_from: list = None, lag_interval: float = 5,
+            min_batch=10, max_batch=100000, burst: float = 1.0
+    ):
+        """
+        Args:
+            rows_per_sec: 每秒最多处理的行数
+            statements_per_sec: 每秒最多执行的语句数
+            target_latency: 每批的目标耗时（秒），超过时减小批大小并退避
+            max_lag: 允许的最大复制延迟（秒）
+            lag_from: 检查复制延迟的从库，MySQL实例或返回延迟秒数的函数
+            lag_interval: 复制延迟的检查间隔（秒），延迟过高时也按这个间隔暂停重试
+            min_batch: 批大小下限
+            max_batch: 批大小上限
+            burst: 令牌桶最多攒多少秒的令牌
+        """
+        assert max_lag is None or lag_from, "max_lag requires lag_from"
+        self.rows = TokenBucket(rows_per_sec, burst) if rows_per_sec else None
+        self.statements = TokenBucket(statements_per_sec, burst) if statements_per_sec else None
+        self.target_latency = target_latency
+        self.max_lag = max_lag
+        self.lag_from = list(lag_from or [])
+        self.lag_interval = lag_interval
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+
+        self._lock = threading.Lock()
+        self._size = None
+        self._lag = None
+        self._lag_checked = 0.0
+        self._counters = dict(batches=0, rows=0, waited=0.0, paused=0.0, backoffs=0, grows=0)
+
+    def batch(self, default: int) -> int:
+        """当前的批大小，第一次调用时以default为初始值"""
+        with self._lock:
+            if self._size is None:
+                self._size = max(self.min_batch, min(self.max_batch, default))
+            return self._size
+
+    def pace(self, rows: int):
+        """执行一批之前调用：复制延迟过高时暂停，令牌不够时等待"""
+        if self.max_lag is not None:
+            self._wait_lag()
+        wait = 0.0
+        if self.rows:
+            wait = max(wait, self.rows.take(rows))
+        if self.statements:
+            wait = max(wait, self.statements.take(1))
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            self._counters['batches'] += 1
+            self._counters['rows'] += rows
+            self._counters['waited'] += wait
+
+    def observe(self, seconds: float):
+        """执行一批之后调用：根据耗时调整批大小，超过目标耗时时退避"""
+        if self.target_latency is None:
+            return
+        with self._lock:
+            if self._size is None:
+                return
+            if seconds > self.target_latency:
+                self._size = max(self.min_batch, self._size // 2)
+                self._counters['backoffs'] += 1
+            elif seconds < self.target_latency * 0.5 and self._size < self.max_batch:
+                self._size = min(self.max_batch, self._size + max(1, self._size // 4))
+                self._counters['grows'] += 1
+        if seconds > self.target_latency:  # 给数据库喘息的时间
+            time.sleep(min(seconds - self.target_latency, self.target_latency))
+
+    def lag(self) -> float | None:
+        """所有从库中最大的复制延迟，lag_interval秒内复用上次的结果"""
+        with self._lock:
+            if time.monotonic() - self._lag_checked < self.lag_interval:
+                return self._lag
+        lags = [probe() if callable(probe) else replication_lag(probe) for probe in self.lag_from]
+        lags = [v for v in lags if v is not None]
+        with self._lock:
+            self._lag = max(lags) if lags else None
+            self._lag_checked = time.monotonic()
+            return self._lag
+
+    def _wait_lag(self):
+        """复制延迟超过max_lag时暂停，同时把批大小减半"""
+        shrunk = False
+        while (lag := self.lag()) is not None and lag > self.max_lag:
+            if not shrunk:
+                with self._lock:
+                    if self._size is not None:
+                        self._size = max(self.min_batch, self._size // 2)
+                    self._counters['backoffs'] += 1
+                shrunk = True
+            time.sleep(self.lag_interval)
+            with self._lock:
+                self._counters['paused'] += self.lag_interval
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            {batch, lag, batches, rows, waited, paused, backoffs, grows}
+        """
+        with self._lock:
+            return dict(batch=self._size, lag=self._lag, **self._counters)
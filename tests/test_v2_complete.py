@@ -17,6 +17,8 @@ from pathlib import Path
 if __name__ == '__main__':
     sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
+from concurrent.futures import ThreadPoolExecutor
+
 from sqlman.core.v2 import MySQL, Table
 
 # 导入统一配置
@@ -109,6 +111,93 @@ class TestV2MySQL:
         
         return table1
     
+    def test_meta_cache(self):
+        """测试表名、表结构缓存"""
+        print("\n✅ 测试6：表名、表结构缓存")
+        
+        # 连续取表不会重复执行 show tables
+        calls = 0
+        get_tables = self.db.get_tables
+        
+        def counted():
+            nonlocal calls
+            calls += 1
+            return get_tables()
+        
+        self.db.get_tables = counted
+        try:
+            for _ in range(5):
+                self.db[self.test_table_name]
+            print(f"   取表5次，show tables 执行 {calls} 次（应该≤1）")
+        finally:
+            del self.db.get_tables
+        
+        schema = self.db.get_schema(self.test_table_name)
+        print(f"   字段：{schema['columns']}")
+        print(f"   主键：{schema['primary']}，索引：{list(schema['indexes'])}")
+        
+        self.db.refresh()
+        print("   ✓ 缓存已刷新")
+    
+    def test_pool(self):
+        """测试连接池"""
+        print("\n✅ 测试7：连接池状态、超时与自动扩缩容")
+        
+        from sqlman.core.v2.pool import PoolTimeoutError
+        db = MySQL(**TestConfig.MYSQL_CONF, maxconnections=2, pool_timeout=0.5, prewarm=2, ping_idle=30)
+        print(f"   预热后：{db.pool_stats()}")
+        
+        cons = [db._pool.connection() for _ in range(2)]
+        try:
+            db._pool.connection()
+        except PoolTimeoutError as e:
+            print(f"   名额用完时超时：{e}")
+        finally:
+            for con in cons:
+                con.close()
+        
+        db = MySQL(**TestConfig.MYSQL_CONF, maxconnections=8, adaptive_pool=True)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: db.exe_sql('select sleep(0.01)'), range(400)))
+        stats = db.pool_stats()
+        print(f"   自动扩容：名额 {stats['size']}，扩容 {stats['grows']} 次，等待 p95={stats['wait']['p95']*1000:.2f}ms")
+    
+    def test_replicas(self):
+        """测试读写分离"""
+        print("\n✅ 测试8：读写分离 primary / replicas")
+        
+        # 没有从库环境时，把主库同时当作从库，验证路由和统计
+        db = MySQL(primary=TestConfig.MYSQL_CONF, replicas=[TestConfig.MYSQL_CONF], replica_policy='least_loaded')
+        table = db[self.test_table_name]
+        print(f"   从库查询：{table.query_count()} 条，最大id {table.get_max('id')}")
+        with db.session():
+            print(f"   会话中读主库：{table.query_count()} 条")
+        print(f"   从库状态：{db.replica_stats()}")
+    
+    def test_sharding(self):
+        """测试分库"""
+        print("\n✅ 测试9：分库 ShardedMySQL")
+        
+        from sqlman.core.v2 import ShardedMySQL
+        # 没有多个实例时，用同一个库的两张表模拟两个分片
+        names = ['test_shard_0', 'test_shard_1']
+        for name in names:
+            if name in self.db.get_tables():
+                self.db.remove_table(name)
+            self.db.exe_sql(f'create table {name} like {self.test_table_name}')
+        self.db.refresh()
+        sharded = ShardedMySQL([self.db, self.db], key='id')
+        table = sharded['test_shard_0']
+        table.tables = [self.db[name] for name in names]
+        
+        rows = self.db[self.test_table_name].query(limit=100)
+        print(f"   拆分写入：{table.insert_data(rows)} 条，各分片 {[t.query_count() for t in table.tables]}")
+        print(f"   按分片键查询：{table.get(rows[0]['id'])['id']}，汇总数量：{table.query_count()}")
+        stats = table.scan(dealer=lambda lines: None, log=False, rest=0)
+        print(f"   并行扫描：{stats['rows']} 条")
+        for name in names:
+            self.db.remove_table(name)
+    
     def run_all(self):
         """运行所有测试"""
         if not self.setup():
@@ -119,6 +208,10 @@ class TestV2MySQL:
         self.test_get_tables()
         table = self.test_create_test_table()
         self.test_pick_table()
+        self.test_meta_cache()
+        self.test_pool()
+        self.test_replicas()
+        self.test_sharding()
         
         print("\n" + "="*80)
         print("✅ MySQL 类测试完成")
@@ -177,6 +270,81 @@ class TestV2Table:
             ages = [d['age'] for d in data]
             print(f"   年龄分布：{set(ages)}")
     
+    def test_iter_query(self):
+        """测试流式查询"""
+        print("\n✅ 测试3.1：流式查询")
+        
+        rows = 0
+        for _ in self.table.iter_query(pick='id, name'):
+            rows += 1
+        print(f"   逐行流式查询：得到 {rows} 条")
+        
+        sizes = [len(chunk) for chunk in self.table.query(stream=True, chunk=100)]
+        print(f"   分批流式查询（每批100）：{sizes}")
+        
+        # 提前结束也会归还连接
+        gen = self.table.iter_query()
+        first = next(gen)
+        gen.close()
+        print(f"   提前关闭生成器：第一条 id={first['id']}")
+    
+    def test_paginate(self):
+        """测试keyset分页"""
+        print("\n✅ 测试3.1.1：分页 paginate")
+        
+        after, pages, total = None, 0, 0
+        while pages < 5:
+            page = self.table.paginate(order_by=('age', 'id'), page_size=20, after=after, pick='id, name')
+            pages += 1
+            total += len(page['rows'])
+            after = page['next']
+            if after is None:
+                break
+        print(f"   前 {pages} 页共 {total} 条，下一页游标：{after[:20] + '...' if after else None}")
+    
+    def test_query_columns(self):
+        """测试列式查询"""
+        print("\n✅ 测试3.2：列式查询")
+        
+        for fmt in ['columns', 'arrays']:
+            data = self.table.query(pick='id, age, name', format=fmt, limit=5)
+            print(f"   {fmt}：{ {k: type(v).__name__ for k, v in data.items()} }，id={list(data['id'])}")
+        
+        # 后面的批次才出现NULL时退回list，已有的值不重复
+        from sqlman.tools import Columns
+        buffer = Columns(['v'], fmt='arrays')
+        buffer.extend([(1,), (2,)])
+        buffer.extend([(3,), (None,), (5,)])
+        print(f"   arrays 后续批次出现 NULL：{buffer.result()['v']}（应该是 [1, 2, 3, None, 5]）")
+        
+        sizes = []
+        self.table.scan(sort_field='id', once=100, dealer=lambda cols: sizes.append(len(cols['id'])), log=False, rest=0, format='columns')
+        print(f"   列式扫描每批行数：{sizes}")
+    
+    def test_row_factory(self):
+        """测试紧凑行"""
+        print("\n✅ 测试3.3：紧凑行 row_factory")
+        
+        for factory in ['tuple', 'slots']:
+            rows = self.table.query(pick='id, name', limit=2, row_factory=factory)
+            row = rows[0]
+            print(f"   {factory}：{row}，row['id']={row['id']}，row.name={row.name}，dict={dict(row)}")
+        
+        # 字段名与方法重名时退回dict
+        rows = self.table.query(pick='id, name as items', limit=1, row_factory='slots')
+        print(f"   字段 items：{type(rows[0]).__name__}，{rows[0]['items']}")
+    
+    def test_get_many(self):
+        """测试按主键批量获取"""
+        print("\n✅ 测试3.4：按主键批量获取 get_many")
+        
+        ids = [u['id'] for u in self.table.query(pick='id', limit=5)]
+        keys = ids[::-1] + [ids[0], 999999]
+        rows = self.table.get_many(keys, chunk=2, workers=2)
+        print(f"   按输入顺序返回：{[r['id'] if r else None for r in rows]}（最后一个不存在为None）")
+        print(f"   再次获取（命中LRU）：{list(self.table.get_many(ids, as_dict=True).keys())}")
+        print(f"   get单条：{self.table.get(ids[0])}")
+    
     def test_exists(self):
         """测试数据存在性检查"""
         print("\n✅ 测试4：检查数据存在性")
@@ -208,6 +376,17 @@ class TestV2Table:
         many = self.table.random(limit=5)
         print(f"   随机5条（返回 list）：得到 {len(many) if many else 0} 条")
     
+    def test_sample(self):
+        """测试均匀采样"""
+        print("\n✅ 测试5.1：均匀采样")
+        
+        for method in ['range', 'bernoulli', 'reservoir']:
+            rows = self.table.sample(10, method=method)
+            print(f"   {method:9s} 采样10条：得到 {len(rows)} 条，id={sorted(r['id'] for r in rows)}")
+        
+        rows = self.table.sample(5, gender='女')
+        print(f"   条件采样（gender='女'）：得到 {len(rows)} 条，性别 {set(r['gender'] for r in rows)}")
+    
     def test_get_min_max(self):
         """测试获取最小/最大值"""
         print("\n✅ 测试6：获取字段最小/最大值")
@@ -254,6 +433,20 @@ class TestV2Table:
         print(f"   插入 {len(data)} 条数据，影响行数：{affect}")
         self.test_data.extend(data)
     
+    def test_insert_chunks(self):
+        """测试按字节分批插入"""
+        print("\n✅ 测试8.1：按字节分批插入")
+        
+        data = [{'name': f'分批{i}', 'age': 30, 'address': 'x' * 100} for i in range(300)]
+        reports = self.table.insert_data(data, chunk_bytes=8 * 1024, report=True)
+        print(f"   插入 {len(data)} 条，分成 {len(reports)} 批，影响行数：{sum(r['affect'] for r in reports)}")
+        for r in reports[:3]:
+            print(f"     {r['rows']} 条 / {r['bytes']} 字节 / {r['elapsed']:.3f}s / 错误 {r['error']}")
+        
+        affect = self.table.insert_data(data[:10], chunk_bytes=1024, commit='once')
+        print(f"   单事务分批插入 10 条，影响行数：{affect}")
+        self.table.delete(age=30, name=[d['name'] for d in data])
+    
     def test_insert_with_conflict(self):
         """测试冲突处理"""
         print("\n✅ 测试9：插入冲突处理")
@@ -291,6 +484,40 @@ class TestV2Table:
         
         affect = self.table.dedup_insert_data(data, dedup='phone')
         print(f"   去重插入 {len(data)} 条，实际插入 {affect} 条（自动过滤重复）")
+        
+        # 依赖唯一索引（主键 id），一条SQL完成判断和插入
+        first = self.table.query(pick='id', limit=1)[0]['id']
+        data = [
+            {'id': first, 'name': '去重4', 'age': 28},  # 已存在
+            {'id': 88888, 'name': '去重5', 'age': 29},
+        ]
+        result = self.table.dedup_insert_data(data, dedup='id', mode='index', detail=True)
+        print(f"   唯一索引去重：插入 {result['affect']} 条，新值 {result['new']}，已存在 {result['old']}")
+        self.table.delete(id=88888)
+        
+        # 非字符串的键：按列类型比较（Decimal/浮点、带微秒的时间、布尔）
+        from datetime import datetime
+        from decimal import Decimal
+        name = 'test_dedup_types'
+        self.db.exe_sql(f'drop table if exists {name}')
+        self.db.exe_sql(f'''
+            create table {name} (
+                id int auto_increment primary key,
+                price decimal(10, 2) unique, at datetime(6) unique, flag tinyint(1) unique
+            )
+        ''')
+        self.db.refresh()
+        typed = self.db[name]
+        at = datetime(2024, 1, 1, 8, 0, 0, 123456)
+        typed.insert_data([{'price': Decimal('1.50'), 'at': at, 'flag': 1}])
+        for dedup, values, expect in [
+            ('price', [1.5, Decimal('2.25')], '1.5 已存在'),
+            ('at', [at, at.replace(microsecond=654321)], '123456 微秒已存在'),
+            ('flag', [True, False], 'True 已存在'),
+        ]:
+            result = typed.dedup_insert_data([{dedup: v} for v in values], dedup=dedup, mode='index', detail=True)
+            print(f"   {dedup}：新值 {result['new']}，已存在 {result['old']}（应该 {expect}）")
+        self.db.remove_table(name)
     
     def test_update_basic(self):
         """测试基本更新"""
@@ -349,6 +576,19 @@ class TestV2Table:
             affect = self.table.update_some(users, depend='id')
             print(f"   使用一条SQL更新 {len(users)} 条，影响行数：{affect}")
     
+    def test_update_bulk(self):
+        """测试 update_bulk（临时表JOIN）"""
+        print("\n✅ 测试14.1：update_bulk 方法")
+        
+        users = self.table.query(pick='id, salary', limit=50)
+        if users:
+            for user in users:
+                user['salary'] = (user.get('salary') or 0) + 1
+            affect1 = self.table.update_bulk(users, depend='id', strategy='temp')
+            affect2 = self.table.update_bulk(users, depend='id', strategy='case')
+            affect3 = self.table.update_bulk(users, depend='id')
+            print(f"   temp 方式影响 {affect1} 行，case 方式影响 {affect2} 行，auto 方式影响 {affect3} 行")
+    
     def test_cvs(self):
         """测试 cvs（检查值存在性）"""
         print("\n✅ 测试15：cvs 方法（检查值存在性）")
@@ -359,6 +599,45 @@ class TestV2Table:
         print(f"   不存在的：{new_phones}")
         print(f"   已存在的：{old_phones}")
     
+    def test_transaction(self):
+        """测试会话/事务"""
+        print("\n✅ 测试15.1：会话与事务")
+        
+        # 多条语句共用一个连接，结束时提交一次
+        users = self.table.query(pick='id', limit=5)
+        with self.table.transaction():
+            for user in users:
+                self.table.update(new={'mark': 'T'}, id=user['id'])
+        print(f"   事务内更新 {len(users)} 条，提交后查询：{self.table.query_count(mark='T')} 条")
+        
+        # 出错回滚
+        try:
+            with self.table.transaction():
+                self.table.update(new={'mark': 'R'}, id=users[0]['id'])
+                raise RuntimeError('模拟出错')
+        except RuntimeError:
+            pass
+        print(f"   出错回滚后 mark='R' 的数量：{self.table.query_count(mark='R')}（应该是0）")
+    
+    def test_result_cache(self):
+        """测试结果缓存"""
+        print("\n✅ 测试15.2：结果缓存 enable_cache")
+        
+        self.table.enable_cache(ttl=30, max_entries=100)
+        try:
+            users = self.table.query(pick='id', limit=1)
+            count1 = self.table.query_count(mark='C')
+            count2 = self.table.query_count(mark='C')
+            stats = self.table.cache_stats()
+            print(f"   两次相同查询：{count1} / {count2}，命中 {stats['hits']} 次，未命中 {stats['misses']} 次")
+            
+            # 写操作后缓存失效
+            self.table.update(new={'mark': 'C'}, id=users[0]['id'])
+            print(f"   更新后再次查询：{self.table.query_count(mark='C')}（应该比之前多1）")
+            print(f"   统计：{self.table.cache_stats()}")
+        finally:
+            self.table.disable_cache()
+    
     def test_delete(self):
         """测试删除"""
         print("\n" + "="*80)
@@ -412,6 +691,100 @@ class TestV2Table:
         )
         
         print(f"   扫描完成，共处理 {total_count} 条数据")
+        
+        # 多线程分片扫描
+        total_count = 0
+        stats = self.table.scan(sort_field='id', once=50, dealer=counter, log=False, rest=0, workers=4, serial=True)
+        print(f"   4线程扫描：共处理 {total_count} 条，统计 {stats['rows']} 条 / {stats['batches']} 批")
+        for shard in stats['shards']:
+            print(f"     分片 {shard['start']}~{shard['end']}：{shard['rows']} 条，耗时 {shard['elapsed']:.3f}s")
+        
+        # 非数值、多字段排序
+        total_count = 0
+        stats = self.table.scan(sort_field=('name', 'id'), once=50, dealer=counter, log=False, rest=0)
+        print(f"   按 (name, id) 扫描：共处理 {total_count} 条（应该等于总数 {self.table.query_count()}）")
+        total_count = 0
+        stats = self.table.scan(sort_field='age', once=7, dealer=counter, log=False, rest=0)
+        print(f"   按非唯一字段 age 扫描（自动补主键）：共处理 {total_count} 条")
+        
+        # 按行数均衡切分
+        ranges = self.table.split_ranges('id', parts=4)
+        print(f"   均衡切分：{ranges}")
+        stats = self.table.scan(sort_field='id', once=50, dealer=counter, log=False, rest=0, workers=4, ranges=ranges)
+        print(f"   按均衡分片扫描：每片 {[shard['rows'] for shard in stats['shards']]} 条")
+        
+        # 检查点：中途失败后从保存的位置继续，完成后清除
+        import os
+        import tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'scan.json')
+        seen = []
+        
+        def crash(lines):
+            if len(seen) >= 100:
+                raise RuntimeError('模拟中断')
+            seen.extend(line['id'] for line in lines)
+        
+        try:
+            self.table.scan(once=50, dealer=crash, log=False, rest=0, workers=2, checkpoint=path)
+        except RuntimeError:
+            print(f"   中断前处理 {len(seen)} 条，检查点已保存：{os.path.exists(path)}")
+        stats = self.table.scan(
+            once=50, dealer=lambda lines: seen.extend(line['id'] for line in lines), log=False, rest=0, workers=2,
+            checkpoint=path
+        )
+        print(f"   继续扫描 {stats['rows']} 条，合计去重 {len(set(seen))} 条，检查点已清除：{not os.path.exists(path)}")
+        
+        # 宽表：先沿索引只查键，再按键查完整的行（deferred），或一条语句延迟关联（join）
+        for mode in ('deferred', 'join'):
+            total_count = 0
+            stats = self.table.scan(once=50, dealer=counter, log=False, rest=0, mode=mode, add_cond='age < 30')
+            print(f"   {mode} 模式：共处理 {total_count} 条 / {stats['batches']} 批")
+    
+    def test_stats(self):
+        """测试语句指标"""
+        print("\n✅ 测试18：语句指标 stats")
+        
+        stats = self.table.stats(top=3)
+        for fp, item in stats['statements'].items():
+            print(f"   {fp[:60]}：{item['count']} 次，p50={item['p50']*1000:.2f}ms，p99={item['p99']*1000:.2f}ms，{item['rows']} 行")
+        if 'pool_wait' in stats:
+            print(f"   连接池等待：p95={stats['pool_wait']['p95']*1000:.3f}ms，错误数：{stats['errors']}")
+        self.table.reset_stats()
+        print(f"   重置后：{self.table.stats()['statements']}")
+    
+    def test_slow_log(self):
+        """测试慢语句记录"""
+        print("\n✅ 测试19：慢语句记录 slow_log")
+        
+        from sqlman.core.v2.slow import SlowLog
+        db = MySQL(**TestConfig.MYSQL_CONF, slow_log=SlowLog(threshold=0, explain=1, size=10))
+        db[self.table.name.strip('`')].query(pick='id', name='不存在', limit=1)
+        for record in db.slow_queries()[-1:]:
+            print(f"   {record['fingerprint']}：{record['seconds']}s，参数 {record['args']}")
+            print(f"   全表扫描：{record.get('full_scans')}，使用索引：{record.get('keys')}")
+        
+        # 名额只有1个时不等待EXPLAIN的连接，记录explain_error
+        db = MySQL(**TestConfig.MYSQL_CONF, maxconnections=1, slow_log=SlowLog(threshold=0, explain=1))
+        db.exe_sql('select 1')
+        print(f"   名额用完时：{db.slow_queries()[-1].get('explain_error')}")
+    
+    def test_throttle(self):
+        """测试节流"""
+        print("\n✅ 测试20：节流 Throttle")
+        
+        from sqlman.core.v2.throttle import Throttle
+        throttle = Throttle(rows_per_sec=2000, target_latency=0.05, min_batch=10, max_batch=500)
+        total = []
+        stats = self.table.scan(once=50, dealer=total.extend, log=False, throttle=throttle)
+        print(f"   节流扫描：{stats['rows']} 条 / {stats['batches']} 批，耗时 {stats['elapsed']:.2f}s")
+        print(f"   节流统计：{throttle.stats()}")
+        
+        throttle = Throttle(statements_per_sec=20, max_batch=20)
+        items = [dict(name='节流', age=i % 100) for i in range(100)]
+        affect = self.table.insert_data(items, throttle=throttle)
+        print(f"   节流插入 {affect} 条，{throttle.stats()['batches']} 批")
+        affect = self.table.delete_bulk(once=30, throttle=throttle, name='节流')
+        print(f"   分批删除 {affect} 条，累计 {throttle.stats()['batches']} 批")
     
     def run_all(self):
         """运行所有测试"""
@@ -419,13 +792,20 @@ class TestV2Table:
         self.test_query_count()
         self.test_query_basic()
         self.test_query_in()
+        self.test_iter_query()
+        self.test_paginate()
+        self.test_query_columns()
+        self.test_row_factory()
+        self.test_get_many()
         self.test_exists()
         self.test_random()
+        self.test_sample()
         self.test_get_min_max()
         
         # 插入测试
         self.test_insert_single()
         self.test_insert_batch()
+        self.test_insert_chunks()
         self.test_insert_with_conflict()
         self.test_dedup_insert()
         
@@ -434,13 +814,19 @@ class TestV2Table:
         self.test_update_one()
         self.test_update_many()
         self.test_update_some()
+        self.test_update_bulk()
         self.test_cvs()
+        self.test_transaction()
+        self.test_result_cache()
         
         # 删除测试
         self.test_delete()
         
         # 扫描测试
         self.test_scan()
+        self.test_stats()
+        self.test_slow_log()
+        self.test_throttle()
         
         print("\n" + "="*80)
         print("✅ Table 类测试完成")
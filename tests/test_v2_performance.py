@@ -72,6 +72,33 @@ class PerformanceTest:
             speed = size / elapsed if elapsed > 0 else 0
             print(f"  插入 {size:4d} 条：耗时 {elapsed:.3f}s，速度 {speed:.0f} 条/秒，影响 {affect} 行")
     
+    def test_bulk_load(self):
+        """测试 LOAD DATA 批量导入性能（对比 insert_data）"""
+        print("\n" + "="*70)
+        print("📊 测试1.1：bulk_load 与 insert_data 对比")
+        print("="*70)
+        
+        size = 20000
+        data = [
+            {'name': f'导入用户{i}', 'age': 20 + i % 40, 'gender': '男' if i % 2 == 0 else '女', 'address': f'地址\t{i}\n'}
+            for i in range(size)
+        ]
+        
+        start = time.time()
+        affect1 = self.table.insert_data(data)
+        elapsed1 = time.time() - start
+        
+        start = time.time()
+        affect2 = self.table.bulk_load(data)
+        elapsed2 = time.time() - start
+        
+        speed1 = size / elapsed1 if elapsed1 > 0 else 0
+        speed2 = size / elapsed2 if elapsed2 > 0 else 0
+        print(f"  insert_data {size} 条：耗时 {elapsed1:.3f}s，速度 {speed1:.0f} 条/秒，影响 {affect1} 行")
+        print(f"  bulk_load   {size} 条：耗时 {elapsed2:.3f}s，速度 {speed2:.0f} 条/秒，影响 {affect2} 行")
+        
+        self.table.delete(name=[d['name'] for d in data])
+    
     def test_batch_update(self):
         """测试批量更新性能"""
         print("\n" + "="*70)
@@ -106,7 +133,27 @@ class PerformanceTest:
             elapsed = time.time() - start
             speed = size / elapsed if elapsed > 0 else 0
             print(f"  update_some {size:3d} 条：耗时 {elapsed:.3f}s，速度 {speed:.0f} 条/秒")
+            
+            # update_bulk 临时表方式
+            for item in data:
+                item['age'] = item['age'] + 1
+            
+            start = time.time()
+            affect = self.table.update_bulk(data, depend='id', strategy='temp')
+            elapsed = time.time() - start
+            speed = size / elapsed if elapsed > 0 else 0
+            print(f"  update_bulk {size:3d} 条：耗时 {elapsed:.3f}s，速度 {speed:.0f} 条/秒")
             print()
+        
+        # 大批量：临时表 JOIN
+        data = self.table.query(pick='id, salary', limit=10000)
+        for item in data:
+            item['salary'] = (item['salary'] or 0) + 1
+        start = time.time()
+        affect = self.table.update_bulk(data, depend='id')
+        elapsed = time.time() - start
+        speed = len(data) / elapsed if elapsed > 0 else 0
+        print(f"  update_bulk {len(data)} 条（auto）：耗时 {elapsed:.3f}s，速度 {speed:.0f} 条/秒，影响 {affect} 行")
     
     def test_query_performance(self):
         """测试查询性能"""
@@ -125,6 +172,47 @@ class PerformanceTest:
             speed = len(data) / elapsed if elapsed > 0 else 0
             print(f"  查询 {limit:4d} 条：耗时 {elapsed:.3f}s，速度 {speed:.0f} 条/秒，实际 {len(data)} 条")
     
+    def test_format_memory(self):
+        """测试不同结果格式的内存占用"""
+        print("\n" + "="*70)
+        print("📊 测试3.2：结果格式内存占用（字节/行）")
+        print("="*70)
+        
+        import tracemalloc
+        
+        formats = ['rows', 'tuple', 'slots', 'columns', 'arrays']
+        try:
+            import numpy  # noqa
+            formats.append('numpy')
+        except ImportError:
+            pass
+        
+        for fmt in formats:
+            tracemalloc.start()
+            start = time.time()
+            if fmt in ('tuple', 'slots'):
+                data = self.table.query(pick='id, age, salary, name', row_factory=fmt)
+            else:
+                data = self.table.query(pick='id, age, salary, name', format=fmt)
+            elapsed = time.time() - start
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rows = len(data) if isinstance(data, list) else len(data['id'])
+            print(f"  {fmt:8s}：{rows} 行，占用 {size / max(rows, 1):.0f} 字节/行，峰值 {peak / max(rows, 1):.0f} 字节/行，耗时 {elapsed:.3f}s")
+            del data
+    
+    def test_sample_performance(self):
+        """测试采样性能"""
+        print("\n" + "="*70)
+        print("📊 测试3.1：sample 采样性能")
+        print("="*70)
+        
+        for method in ['range', 'bernoulli', 'reservoir']:
+            start = time.time()
+            rows = self.table.sample(1000, method=method)
+            elapsed = time.time() - start
+            print(f"  {method:9s} 采样 1000 条：耗时 {elapsed:.3f}s，得到 {len(rows)} 条")
+    
     def test_scan_performance(self):
         """测试扫描性能"""
         print("\n" + "="*70)
@@ -154,6 +242,23 @@ class PerformanceTest:
         
         speed = total_processed / elapsed if elapsed > 0 else 0
         print(f"  扫描全表：耗时 {elapsed:.3f}s，处理 {total_processed} 条，速度 {speed:.0f} 条/秒")
+        
+        # 预取：查询与 dealer 并行（模拟耗时的 dealer）
+        def slow_counter(lines):
+            time.sleep(0.005)
+            counter(lines)
+        
+        for prefetch in [0, 2]:
+            total_processed = 0
+            stats = self.table.scan(sort_field='id', once=1000, dealer=slow_counter, log=False, rest=0, prefetch=prefetch)
+            print(f"  prefetch={prefetch} 扫描：耗时 {stats['elapsed']:.3f}s，处理 {stats['rows']} 条")
+        
+        # 多线程分片扫描
+        for workers in [2, 4]:
+            total_processed = 0
+            stats = self.table.scan(sort_field='id', once=1000, dealer=counter, log=False, rest=0, workers=workers)
+            speed = stats['rows'] / stats['elapsed'] if stats['elapsed'] > 0 else 0
+            print(f"  {workers}线程扫描：耗时 {stats['elapsed']:.3f}s，处理 {stats['rows']} 条，速度 {speed:.0f} 条/秒")
     
     def test_dedup_insert_performance(self):
         """测试去重插入性能"""
@@ -202,8 +307,11 @@ class PerformanceTest:
         try:
             self.setup()
             self.test_batch_insert()
+            self.test_bulk_load()
             self.test_batch_update()
             self.test_query_performance()
+            self.test_format_memory()
+            self.test_sample_performance()
             self.test_scan_performance()
             self.test_dedup_insert_performance()
             
@@ -1,3 +1,13 @@
+import base64
+import datetime
+import decimal
+import json
+import queue
+import re
+import threading
+from array import array
+
+
 def getfv(data: dict | list) -> tuple:
     item = data if isinstance(data, dict) else data[0]
     fs = []
@@ -69,6 +79,285 @@ def make_tail(_where: str, _limit: int = None):
     return tail
 
 
+def make_row_cmp(fields: list, op: str) -> str:
+    """
+    行构造器比较，比如 (`a`, `b`) > (%s, %s)，单个字段时为 `a` > %s\n
+    MySQL会把它当作联合索引上的范围读取
+    """
+    names = ['`{}`'.format(f.strip('`')) for f in fields]
+    if len(names) == 1:
+        return '{} {} %s'.format(names[0], op)
+    return '({}) {} ({})'.format(', '.join(names), op, ', '.join(['%s'] * len(names)))
+
+
+def _json_default(v):
+    if isinstance(v, datetime.datetime):
+        return {'$dt': v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {'$d': v.isoformat()}
+    if isinstance(v, datetime.timedelta):
+        return {'$td': v.total_seconds()}
+    if isinstance(v, decimal.Decimal):
+        return {'$dec': str(v)}
+    if isinstance(v, (bytes, bytearray)):
+        return {'$b': base64.b64encode(bytes(v)).decode()}
+    raise TypeError('cannot encode {!r} into json'.format(v))
+
+
+def _json_hook(d: dict):
+    if len(d) == 1:
+        (k, v), = d.items()
+        if k == '$dt':
+            return datetime.datetime.fromisoformat(v)
+        if k == '$d':
+            return datetime.date.fromisoformat(v)
+        if k == '$td':
+            return datetime.timedelta(seconds=v)
+        if k == '$dec':
+            return decimal.Decimal(v)
+        if k == '$b':
+            return base64.b64decode(v)
+    return d
+
+
+def dump_json(obj) -> str:
+    """序列化成JSON，datetime、date、timedelta、Decimal、bytes可以被load_json还原"""
+    return json.dumps(obj, default=_json_default, separators=(',', ':'), ensure_ascii=False)
+
+
+def load_json(raw: str | bytes):
+    """反序列化dump_json的结果"""
+    return json.loads(raw, object_hook=_json_hook)
+
+
+def encode_cursor(fields: list, values: list) -> str:
+    """把排序字段和最后一行的值编码成不透明的游标字符串（可以放在URL里）"""
+    raw = dump_json([list(fields), list(values)])
+    return base64.urlsafe_b64encode(raw.encode('utf8')).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, fields: list) -> list:
+    """解码游标，排序字段不一致时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        encoded, values = load_json(raw)
+    except Exception as e:
+        raise ValueError('invalid cursor: {}'.format(cursor)) from e
+    if encoded != list(fields):
+        raise ValueError('cursor was created for order_by {}, not {}'.format(encoded, list(fields)))
+    return values
+
+
+def split_range(start: int, end: int, parts: int) -> list:
+    """
+    把闭区间 [start, end] 均分成最多parts个互不重叠的闭区间
+
+    Returns:
+        [(lo, hi), (lo, hi), ...]
+    """
+    assert isinstance(start, int) and isinstance(end, int), "only integer ranges can be split"
+    if end < start:
+        return []
+    size = max((end - start + 1 + parts - 1) // parts, 1)
+    ranges = []
+    lo = start
+    while lo <= end:
+        hi = min(lo + size - 1, end)
+        ranges.append((lo, hi))
+        lo = hi + 1
+    return ranges
+
+
+# print("split_range\n{}\n".format(split_range(1, 10, 3)))
+
+
+def prefetch(iterable, size: int = 1):
+    """
+    在后台线程中提前迭代iterable，最多缓存size个元素\n
+    迭代中的异常会在消费方重新抛出，消费方提前结束时后台线程也会停止
+    """
+    buffer = queue.Queue(maxsize=max(size, 1))
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((True, item)):
+                    return
+            put((True, done))
+        except BaseException as e:
+            put((False, e))
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close:
+                close()
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            ok, item = buffer.get()
+            if not ok:
+                raise item
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def is_read_sql(sql: str) -> bool:
+    """是否为只读SQL（不需要提交）"""
+    if not re.match(r'\s*(select|show|desc|describe|explain)\b', sql, re.I):
+        return False
+    # 加锁读、select into 仍然需要提交
+    return not re.search(r'\bfor\s+(update|share)\b|\block\s+in\s+share\s+mode\b|\binto\b', sql, re.I)
+
+
+def estimate_bytes(values) -> int:
+    """估算一行数据编码进SQL后的字节数"""
+    size = 3  # (),
+    for v in values:
+        if v is None:
+            size += 5
+        elif isinstance(v, str):
+            size += (len(v) if v.isascii() else len(v.encode('utf8'))) + 3
+        elif isinstance(v, (bytes, bytearray)):
+            size += len(v) * 2 + 10  # 转义最坏情况
+        else:
+            size += len(str(v)) + 1
+    return size
+
+
+def chunk_by_bytes(items: list, budget: int):
+    """
+    按估算的编码字节数把items分批，每批不超过budget（单条超过budget时单独成批）
+
+    Returns:
+        生成器，每次产出 (批, 估算字节数)
+    """
+    chunk, size = [], 0
+    for item in items:
+        n = estimate_bytes(item.values() if isinstance(item, dict) else item)
+        if chunk and size + n > budget:
+            yield chunk, size
+            chunk, size = [], 0
+        chunk.append(item)
+        size += n
+    if chunk:
+        yield chunk, size
+
+
+_INFILE_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+
+
+def make_infile_line(values) -> bytes:
+    """
+    把一行数据编码成 LOAD DATA 默认格式的一行\n
+    字段以TAB分隔、以换行结尾，NULL写作\\N，反斜杠、TAB、换行、回车、NUL字节会被转义
+    """
+    parts = []
+    for v in values:
+        if v is None:
+            parts.append(b'\\N')
+        elif isinstance(v, (bytes, bytearray)):
+            parts.append(
+                bytes(v).replace(b'\\', b'\\\\').replace(b'\t', b'\\t').replace(b'\n', b'\\n')
+                .replace(b'\r', b'\\r').replace(b'\0', b'\\0')
+            )
+        elif isinstance(v, bool):
+            parts.append(b'1' if v else b'0')
+        else:
+            parts.append(str(v).translate(_INFILE_ESCAPES).encode('utf8'))
+    return b'\t'.join(parts) + b'\n'
+
+
+def import_numpy():
+    """导入numpy（可选依赖）"""
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("format 'numpy' requires numpy, run: pip install numpy")
+    return numpy
+
+
+class Columns:
+    """
+    列式结果的缓冲区，按批追加tuple行，最后得到 {字段: 值}
+
+    fmt:
+        columns：每列为list\n
+        arrays：整数列、浮点列为array.array（q、d），其他列为list\n
+        numpy：整数列、浮点列为numpy数组（与array共享内存），其他列为object数组，需要安装numpy
+    """
+
+    def __init__(self, names: list, fmt='columns'):
+        assert fmt in ('columns', 'arrays', 'numpy'), "fmt must be 'columns', 'arrays' or 'numpy'"
+        if fmt == 'numpy':
+            import_numpy()
+        self.names = list(names)
+        self.fmt = fmt
+        self.data = None
+
+    @staticmethod
+    def _typecode(values) -> str | None:
+        if all(type(v) is int for v in values):
+            return 'q'
+        if all(type(v) is float for v in values):
+            return 'd'
+        return None
+
+    def extend(self, rows):
+        """追加一批tuple行"""
+        if not rows:
+            return
+        cols = list(zip(*rows))
+        if self.data is None:
+            self.data = []
+            for values in cols:
+                code = self._typecode(values) if self.fmt != 'columns' else None
+                self.data.append(array(code) if code else [])
+        for i, values in enumerate(cols):
+            column = self.data[i]
+            if isinstance(column, array):
+                try:
+                    column.extend(array(column.typecode, values))  # 先整批转换，失败时不会留下半批
+                    continue
+                except (TypeError, OverflowError):  # 出现了NULL或其他类型，退回list
+                    column = self.data[i] = column.tolist()
+            column.extend(values)
+
+    def result(self) -> dict:
+        if self.data is None:
+            self.data = [[] for _ in self.names]
+        if self.fmt != 'numpy':
+            return dict(zip(self.names, self.data))
+        numpy = import_numpy()
+        data = {}
+        for name, column in zip(self.names, self.data):
+            if isinstance(column, array):
+                data[name] = numpy.frombuffer(column, dtype='int64' if column.typecode == 'q' else 'float64')
+            else:
+                data[name] = numpy.array(column, dtype=object)
+        return data
+
+
+def make_columns(rows, names: list, fmt='columns') -> dict:
+    """把tuple行转成列式 {字段: 值}"""
+    buffer = Columns(names, fmt)
+    buffer.extend(rows)
+    return buffer.result()
+
+
 def red_print(s):
     """红色的打印"""
     print('\033[31m{}\033[0m'.format(s))